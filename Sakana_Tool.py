@@ -1,20 +1,29 @@
-import os
+import time
+STARTED = time.perf_counter()
+
+import sys
 import tkinter as tk
 from tkinter import ttk, scrolledtext
 import threading
+import multiprocessing
 from config_tools import DIR
-from xml_handler import XMLProcessor, ExcelMerger
-from pdf_merge_routines import start_merging_routine
-from xml_cache_controller import XMLreading, CacheOperations
+from event_sink import EventSink, configure_logging
+# pipeline keeps pandas and pypdf out of startup; they are loaded by warm_up() once the window is up
+from pipeline import Pipeline, PipelineEvent, warm_up
+from run_metrics import format_run
 
 class PDFMergerApp:
 
+    # Events applied per tick of process_events, and lines kept in the log area
+    EVENTS_PER_TICK = 500
+    MAX_LOG_LINES = 5000
+
     def __init__(self, root):
         self.root = root
         self.root.title("Sakana Tool")
 
         # Configure the main window
-        self.root.geometry('760x320')
+        self.root.geometry('880x320')
 
         # Create a logger
         self.logger_frame = tk.Frame(self.root)
@@ -50,207 +59,226 @@ class PDFMergerApp:
         self.merge_button = tk.Button(self.button_frame, text="Fusão PDFs", command=self.start_merge_thread)
         self.merge_button.pack(side=tk.LEFT, padx=5)
 
+        self.export_button = tk.Button(self.button_frame, text="Exportar Planilhas", command=self.start_export_thread)
+        self.export_button.pack(side=tk.LEFT, padx=5)
+
+        # Enabled only while a pipeline runs; its stages stop at their next checkpoint
+        self.cancel_button = tk.Button(self.button_frame, text="Cancelar", command=self.cancel_pipeline, state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.LEFT, padx=5)
+        self.pipeline = None
+        # Export or cache clearing running outside the pipeline
+        self.task_running = False
+        self.closing = False
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
         # Create a progress bar (only for PDF merging)
         self.progress_frame = tk.Frame(self.root)
         self.progress_frame.pack(fill=tk.X, padx=10, pady=5)
         self.progress = ttk.Progressbar(self.progress_frame, orient=tk.HORIZONTAL, length=700, mode='determinate')
         self.progress.pack(pady=5)
 
-    def log(self, message):
-        """Logs a message to the GUI log text area."""
-        self.log_text.insert(tk.END, message + '\n')
-        self.log_text.yview(tk.END)
+        # Worker threads never touch the widgets; they put events in the sink and process_events applies them
+        self.events = EventSink()
+        self.root.after(100, self.process_events)
 
-    def update_progress(self, value, maximum):
-        """Updates the progress bar value."""
-        self.progress['value'] = value
-        self.progress['maximum'] = maximum
-        self.root.update_idletasks()
+        # Load the heavy libraries in the background once the window is on screen
+        self.warm_up_thread = threading.Thread(target=warm_up, daemon=True)
+        self.root.after(200, self.warm_up_thread.start)
+
+    def log(self, message):
+        """Logs a message to the GUI log text area; safe to call from any thread."""
+        self.events.put(PipelineEvent('log', None, message))
 
     def disable_buttons(self):
         """Disables all buttons and changes their appearance to gray."""
-        buttons = [self.merge_button, self.xml_gestor_button, self.xml_compras_button, self.excel_merge_button, self.scan_xml_files_button]
+        buttons = [self.clear_cache_button, self.merge_button, self.xml_gestor_button, self.xml_compras_button, self.excel_merge_button, self.scan_xml_files_button, self.export_button]
         for button in buttons:
             button.config(state=tk.DISABLED, bg='#A9A9A9')
 
     def enable_buttons(self):
         """Enables all buttons and restores their original appearance."""
-        buttons = [self.merge_button, self.xml_gestor_button, self.xml_compras_button, self.excel_merge_button, self.scan_xml_files_button]
+        buttons = [self.clear_cache_button, self.merge_button, self.xml_gestor_button, self.xml_compras_button, self.excel_merge_button, self.scan_xml_files_button, self.export_button]
         for button in buttons:
             button.config(state=tk.NORMAL, bg='SystemButtonFace')
-
+        self.cancel_button.config(state=tk.DISABLED)
+
+
+    #Pipeline events:
+
+    def process_events(self):
+        """Applies a batch of the events put by the worker threads; runs on the Tk thread.
+
+        The log lines of the batch are inserted at once and only the last progress
+        update is applied, so a burst of messages costs one redraw.
+        """
+        lines = []
+        for event in self.events.drain(self.EVENTS_PER_TICK):
+            if event.kind == 'log':
+                lines.append(event.data)
+            elif event.kind == 'run_metrics':
+                lines.extend(format_run(event.data))
+            elif event.kind == 'progress':
+                self.progress['value'], self.progress['maximum'] = event.data
+            elif event.kind == 'pipeline_finished':
+                self.pipeline = None
+                if self.closing:
+                    self.root.destroy()
+                    return
+                self.enable_buttons()
+            elif event.kind == 'task_finished':
+                # Tasks run outside the pipeline (export, cache clearing) end with their own event
+                self.task_running = False
+                if self.closing:
+                    self.root.destroy()
+                    return
+                self.enable_buttons()
+        if lines:
+            self.append_log(lines)
+        self.root.after(100, self.process_events)
+
+    def append_log(self, lines):
+        """Adds lines to the log area, dropping the oldest ones beyond MAX_LOG_LINES."""
+        self.log_text.insert(tk.END, '\n'.join(lines) + '\n')
+        line_count = int(self.log_text.index('end-1c').split('.')[0]) - 1
+        if line_count > self.MAX_LOG_LINES:
+            self.log_text.delete('1.0', f'{line_count - self.MAX_LOG_LINES + 1}.0')
+        self.log_text.yview(tk.END)
 
     #Threads and respective methods:
 
-    def start_scan_xml_thread(self):
-        """Starts the XML scanning process in a separate thread (no progress bar)."""
+    def start_pipeline(self, stages):
+        """Runs the pipeline stages in a separate thread; with Auto-Pipeline on, the stages after them run too."""
         self.disable_buttons()
-        threading.Thread(target=self.run_scan_xml_files).start()
-
-    def run_scan_xml_files(self):
-        """Runs the XML scanning process for saving new or modified files to a csv."""
-        try:
-            path_to = DIR()
-            
-            xmltocsv = XMLreading(path_to.xml_data, path_to.cache_compras)
-            xmltocsv.process_new_files(path_to.new_compras)
-
-            self.log("XML scanning completed successfully.")
-        except Exception as e:
-            self.log(f"Error scanning XML files: {e}")
-            xmltocsv = XMLreading(path_to.xml_data2,path_to.cache_compras)
+        if self.auto_pipeline.get():
+            stages = Pipeline.downstream(stages)
+        # A chained scan streams its files straight into the extraction
+        self.pipeline = Pipeline(DIR(), streaming=True)
+        self.pipeline.subscribe(self.events.put)
+        self.cancel_button.config(state=tk.NORMAL)
+        threading.Thread(target=self.pipeline.run, args=(stages,), daemon=True).start()
+
+    def cancel_pipeline(self):
+        """Asks the running pipeline to stop; its stages save their progress first, so the next run resumes."""
+        if self.pipeline is not None:
+            self.cancel_button.config(state=tk.DISABLED)
+            self.pipeline.cancel()
+
+    def on_close(self):
+        """Closes the window, first cancelling a running pipeline and waiting for its stages to save their progress.
+
+        A running export or cache clearing is waited for as well.
+        """
+        if self.pipeline is None and not self.task_running:
+            self.root.destroy()
+            return
+        self.closing = True
+        self.root.title("Sakana Tool - encerrando...")
+        self.cancel_pipeline()
 
-        try:
-            gestor_processor = XMLreading(path_to.gestor_data, path_to.cache_gestor)
-            gestor_processor.process_new_files(path_to.new_gestor)
-        except Exception as e:
-            self.log(f"Erro escaneando arquivos do gestor: {e}")
-            gestor_processor = XMLreading(path_to.gestor_data, path_to.cache_gestor)
-            gestor_processor.process_new_files(path_to.new_gestor)
-        finally:
-            self.enable_buttons()
-            self.check_auto_pipeline(self.scan_xml_files_button)
+    def start_scan_xml_thread(self):
+        """Scans the Compras and Gestor XMLs for new or modified files."""
+        self.start_pipeline(['scan_compras', 'scan_gestor'])
 
     def start_xml_gestor_thread(self):
-        """Starts the XML processing for Gestor in a separate thread (no progress bar)."""
-        self.disable_buttons()
-        threading.Thread(target=self.run_xml_gestor_processing).start()
-
-    def run_xml_gestor_processing(self):
         """Runs the XML processing for Gestor."""
-        try:
-            processor = XMLProcessor()
-            path_to = DIR()
-            new_gestor = path_to.new_gestor 
-            xl_gestor = path_to.xl_gestor
-
-            new_files_gestor = processor.load_new_files_list(new_gestor)
-            existing_data_gestor = processor.load_existing_data(xl_gestor, ['chNTR', 'nNF', 'dhEmi', 'xFant'])
-            xml_data_gestor = processor.build_xml_file_mapping(new_files_gestor, existing_data_gestor, extraction_type='gestor')
-            processor.save_xml_data_to_excel(xml_data_gestor, xl_gestor, ['chNTR', 'nNF', 'dhEmi', 'xFant'])
-
-            self.log("XML Gestor processing completed successfully.")
-        except Exception as e:
-            self.log(f"Error processing XML Gestor: {e}")
-        finally:
-            self.enable_buttons()
-            self.check_auto_pipeline(self.xml_gestor_button)
+        self.start_pipeline(['gestor'])
 
     def start_xml_compras_thread(self):
-        """Starts the XML processing for Compras in a separate thread (no progress bar)."""
-        self.disable_buttons()
-        threading.Thread(target=self.run_xml_compras_processing).start()
-
-    def run_xml_compras_processing(self):
         """Runs the XML processing for Compras."""
-        try:
-            processor = XMLProcessor()
-            path_to = DIR()
-            new_compras = path_to.new_compras
-            xl_compras = path_to.xl_compras
-
-            new_files_compras = processor.load_new_files_list(new_compras)
-            existing_data_compras = processor.load_existing_data(xl_compras, ['file_name', 'chNF', 'chNTR', 'xMun', 'vProd'])
-            xml_data_compras = processor.build_xml_file_mapping(new_files_compras, existing_data_compras, extraction_type='compras')
-            processor.save_xml_data_to_excel(xml_data_compras, xl_compras, ['file_name', 'chNF', 'chNTR', 'xMun', 'vProd'])
-            self.log("XML Compras processing completed successfully.")
-        except Exception as e:
-            self.log(f"Error processing XML Compras: {e}")
-        finally:
-            self.enable_buttons()
-            self.check_auto_pipeline(self.xml_compras_button)
+        self.start_pipeline(['compras'])
 
     def start_excel_merge_thread(self):
-        """Starts the Excel merging process in a separate thread (no progress bar)."""
-        self.disable_buttons()
-        threading.Thread(target=self.run_excel_merging).start()
-
-    def run_excel_merging(self):
         """Runs the Excel merging process."""
-        try:
-            path_to = DIR()
-            file1 = path_to.xl_compras
-            file2 = path_to.xl_gestor
-            column_to_merge_on = 'chNTR'
-            output_file = path_to.xl_combi
-            xl_consulta = path_to.xl_consulta
-
-            merger = ExcelMerger(file1, file2, column_to_merge_on, output_file)
-            merger.merge_excel_files()
-            mergerConsulta = ExcelMerger(file1, file2, column_to_merge_on, xl_consulta)
-            mergerConsulta.merge_excel_files()
-            mergerConsulta.transform_to_table(xl_consulta)
-
-
-            self.log("Excel merging completed successfully.")
-        except Exception as e:
-            self.log(f"Error merging Excel files: {e}")
-        finally:
-            self.enable_buttons()
-            self.check_auto_pipeline(self.excel_merge_button)
+        self.start_pipeline(['excel'])
 
     def start_merge_thread(self):
-        """Starts the PDF merging process in a separate thread."""
+        """Runs the PDF merging process."""
+        self.start_pipeline(['merge'])
+
+    def start_export_thread(self):
+        """Starts the export of the stored records to the Excel views in a separate thread."""
         self.disable_buttons()
-        threading.Thread(target=self.run_merging).start()
+        self.task_running = True
+        threading.Thread(target=self.run_export).start()
 
-    def run_merging(self):
-        """Runs the PDF merging process."""
+    def run_export(self):
+        """Exports the Gestor and Compras records to xl_gestor and xl_compras."""
         try:
-            dir = DIR()
-            start_merging_routine(
-                dir=dir,
-                log_callback=self.log,
-                progress_callback=self.update_progress
-            )
+            from record_store import RecordStore
+
+            path_to = DIR()
+            store = RecordStore(path_to.records_db)
+            store.export_excel('gestor', path_to.xl_gestor)
+            store.export_excel('compras', path_to.xl_compras)
+
+            self.log("Excel export completed successfully.")
         except Exception as e:
-            self.log(f"Erro ao iniciar o processo de mesclagem: {e}")
+            self.log(f"Error exporting Excel files: {e}")
         finally:
-            self.enable_buttons()
-            self.check_auto_pipeline(self.merge_button)
-
-    def check_auto_pipeline(self, current_button):
-        """Check if auto-pipeline is enabled and trigger the next button."""
-        if self.auto_pipeline.get():
-            button_sequence = [
-                self.scan_xml_files_button,
-                self.xml_gestor_button,
-                self.xml_compras_button,
-                self.excel_merge_button,
-                self.merge_button
-            ]
-            current_index = button_sequence.index(current_button)
-            if current_index < len(button_sequence) - 1:
-                next_button = button_sequence[current_index + 1]
-
-                next_button.invoke()
+            self.events.put(PipelineEvent('task_finished', None, None))
 
     def clear_cache_thread(self):
         """Starts the cache clearing process in a separate thread."""
         self.disable_buttons()
+        self.task_running = True
         threading.Thread(target=self.run_clear_cache).start()
 
     def run_clear_cache(self):
         """Runs the cache clearing process."""
         try:
+            from xml_cache_controller import CacheOperations
+            from pdf_index import PdfIndex
+
             dir = DIR()
             cache = CacheOperations()
             cache.clear_cache_files(dir.cache_gestor)
-            cache.clear_cache_files(dir.cache_gestor)
+            cache.clear_cache_files(dir.cache_compras)
             cache.clear_cache_files(dir.new_compras)
             cache.clear_cache_files(dir.new_gestor)
-            cache.clear_cache_files(dir.cache_compras)
+            cache.clear_cache_files(dir.scan_state)
+            PdfIndex(dir.pdf_index_db).clear()
 
             self.log("Cache clearing completed successfully.")
         except Exception as e:
             self.log(f"Error clearing cache files: {e}")
         finally:
-            self.enable_buttons()
-
-def main():
-    root = tk.Tk()
-    app = PDFMergerApp(root)
-    root.mainloop()
+            self.events.put(PipelineEvent('task_finished', None, None))
+
+    def measure_startup(self):
+        """Prints when the window appeared and when the libraries finished loading, then closes the app.
+
+        Both times are counted from the start of this module, i.e. after the
+        interpreter (or the frozen executable's bootloader) is up.
+        """
+        shown = []
+
+        def on_map(event):
+            if event.widget is self.root and not shown:
+                shown.append(time.perf_counter() - STARTED)
+
+        def check():
+            if shown and self.warm_up_thread.ident and not self.warm_up_thread.is_alive():
+                print(f"Janela exibida em {shown[0]:.2f}s; bibliotecas carregadas em {time.perf_counter() - STARTED:.2f}s",
+                      flush=True)
+                self.root.destroy()
+            else:
+                self.root.after(20, check)
+
+        self.root.bind('<Map>', on_map, add='+')
+        self.root.after(20, check)
+
+def main(measure_startup=False):
+    listener = configure_logging(DIR().app_log)
+    try:
+        root = tk.Tk()
+        app = PDFMergerApp(root)
+        if measure_startup:
+            app.measure_startup()
+        root.mainloop()
+    finally:
+        listener.stop()
 
 if __name__ == "__main__":
-    main()
+    # Required for the process pool used by XML extraction in the frozen executable
+    multiprocessing.freeze_support()
+    main(measure_startup='--measure-startup' in sys.argv[1:])
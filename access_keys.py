@@ -0,0 +1,72 @@
+import re
+from operator import mul
+
+KEY_LENGTH = 44
+
+# Runs of at least 44 digits in which a key may be split by spaces, dots, dashes
+# or slashes, as in "3524 1234 5678 ..." or "35.24.12.345..."; shorter numbers
+# (CNPJs, phones, order numbers) are skipped by the regex engine itself. Only
+# ASCII digits count: \d would also match e.g. fullwidth digits
+_DIGIT_RUN = re.compile(r'[0-9](?:[\s./-]{0,2}[0-9]){%d,}' % (KEY_LENGTH - 1))
+_SEPARATORS = re.compile(r'[\s./-]+')
+
+# Mod-11 weights of the first 43 digits: 2 to 9 from the rightmost digit, repeating
+_WEIGHTS = tuple(reversed([2 + i % 8 for i in range(KEY_LENGTH - 1)]))
+# The weighted sum is taken over the ASCII codes; this removes the '0' offsets
+_ASCII_OFFSET = ord('0') * sum(_WEIGHTS)
+
+# IBGE codes of the states (cUF), the first two digits of every access key
+_UF_CODES = frozenset({
+    '11', '12', '13', '14', '15', '16', '17', '21', '22', '23', '24', '25', '26', '27', '28', '29',
+    '31', '32', '33', '35', '41', '42', '43', '50', '51', '52', '53',
+})
+_MONTHS = frozenset(f'{month:02d}' for month in range(1, 13))
+
+def check_digit(key_body):
+    """Return the mod-11 check digit of the first 43 digits of an access key.
+
+    Weights 2 to 9 are applied from the rightmost digit and repeat; a remainder
+    of 0 or 1 gives check digit 0, otherwise the digit is 11 - remainder.
+    """
+    remainder = (sum(map(mul, key_body.encode('ascii'), _WEIGHTS)) - _ASCII_OFFSET) % 11
+    return 0 if remainder < 2 else 11 - remainder
+
+def is_access_key(digits):
+    """Return True if digits is a 44-digit NF-e/CT-e access key with a valid state, month and check digit."""
+    return (
+        len(digits) == KEY_LENGTH
+        and digits.isascii()
+        and digits.isdigit()
+        and digits[:2] in _UF_CODES
+        and digits[4:6] in _MONTHS
+        and check_digit(digits[:43]) == int(digits[43])
+    )
+
+def find_access_keys(text):
+    """Return every valid access key found in free text such as infCpl, in order and without repeats.
+
+    Keys may be written whole or split by punctuation; candidates that fail the
+    state, month or check digit validation are ignored. None gives an empty list.
+    """
+    if not text:
+        return []
+
+    keys = []
+    for run in _DIGIT_RUN.finditer(text):
+        digits = _SEPARATORS.sub('', run.group())
+        start = 0
+        # Longer runs may hold several keys or a key glued to other numbers
+        while len(digits) - start >= KEY_LENGTH:
+            candidate = digits[start:start + KEY_LENGTH]
+            if is_access_key(candidate):
+                if candidate not in keys:
+                    keys.append(candidate)
+                start += KEY_LENGTH
+            else:
+                start += 1
+    return keys
+
+def first_access_key(text):
+    """Return the first valid access key in text, or None."""
+    keys = find_access_keys(text)
+    return keys[0] if keys else None
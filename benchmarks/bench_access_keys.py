@@ -0,0 +1,121 @@
+"""Compares the infCpl access-key finder with the former regex heuristic.
+
+Usage:
+    python benchmarks/bench_access_keys.py [--size N] [--repeat N] [--seed N]
+
+A corpus of infCpl texts is generated in memory: keys written whole, grouped in
+fours, dotted or glued to a prefix, texts with two keys, texts with only CNPJs,
+phone numbers, bank data or long order numbers, and keys with a wrong check
+digit. Both extractors are timed over the corpus and scored against the keys
+each text really holds.
+"""
+import os
+import re
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from access_keys import check_digit, find_access_keys, first_access_key
+
+UF_CODES = ['11', '13', '23', '26', '29', '31', '33', '35', '41', '42', '43', '50', '51', '52', '53']
+
+def random_key(rng, valid=True):
+    body = (
+        rng.choice(UF_CODES) + f"{rng.randint(20, 25):02d}{rng.randint(1, 12):02d}"
+        + ''.join(rng.choice('0123456789') for _ in range(14))  # CNPJ
+        + rng.choice(['55', '57']) + f"{rng.randint(1, 9):03d}{rng.randint(1, 999999999):09d}"
+        + rng.choice('12') + ''.join(rng.choice('0123456789') for _ in range(8))
+    )
+    digit = check_digit(body)
+    return body + str(digit if valid else (digit + rng.randint(1, 9)) % 10)
+
+def grouped(key, separator=' '):
+    return separator.join(key[i:i + 4] for i in range(0, len(key), 4))
+
+def noise(rng):
+    return rng.choice([
+        f"PEDIDO DE COMPRA {rng.randint(10**9, 10**10 - 1)}",
+        f"CNPJ {rng.randint(10, 99)}.{rng.randint(100, 999)}.{rng.randint(100, 999)}/0001-{rng.randint(10, 99)}",
+        f"FONE (11) 9{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}",
+        f"BANCO 341 AG {rng.randint(1000, 9999)} CC {rng.randint(10000, 99999)}-{rng.randint(0, 9)}",
+        "DOCUMENTO EMITIDO POR ME OU EPP OPTANTE PELO SIMPLES NACIONAL",
+        f"VALOR APROXIMADO DOS TRIBUTOS R$ {rng.randint(1, 999)},{rng.randint(10, 99)}",
+        f"LOTE {''.join(rng.choice('0123456789') for _ in range(46))}",
+    ])
+
+def make_text(rng):
+    """Return (infCpl text, keys it holds)."""
+    kind = rng.randrange(8)
+    key = random_key(rng)
+    if kind == 0:
+        return f"{noise(rng)} REF NF-e {key} {noise(rng)}", [key]
+    if kind == 1:
+        return f"CHAVE DE ACESSO: {grouped(key)} - {noise(rng)}", [key]
+    if kind == 2:
+        return f"{noise(rng)}; NFe{key};{noise(rng)}", [key]
+    if kind == 3:
+        return f"Chave {grouped(key, '.')} {noise(rng)}", [key]
+    if kind == 4:
+        other = random_key(rng)
+        return f"NF REMESSA {key} NF VENDA {other}", [key, other]
+    if kind == 5:
+        return f"{noise(rng)} {noise(rng)} {noise(rng)}", []
+    if kind == 6:
+        return f"REF {random_key(rng, valid=False)} {noise(rng)}", []
+    return f"{noise(rng)} {key}{rng.randint(10, 99)} {noise(rng)}", [key]
+
+def legacy_first_key(text):
+    """The extraction used before access_keys, guarded against missing infCpl."""
+    if text is None:
+        return None
+    number_match = re.search(r'\b[^\s]{38,}\b', text)
+    return re.sub(r'\D', '', number_match.group(0)) if number_match else None
+
+def score(extractor, corpus):
+    correct = false_matches = 0
+    for text, keys in corpus:
+        found = extractor(text)
+        if found is None:
+            correct += not keys
+        elif keys and found == keys[0]:
+            correct += 1
+        else:
+            false_matches += 1
+    return correct, false_matches
+
+def timed(extractor, texts, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in texts:
+            extractor(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=20000, help='Texts in the corpus (default: 20000)')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed passes; the best is reported (default: 5)')
+    parser.add_argument('--seed', type=int, default=42, help='Corpus seed (default: 42)')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    corpus = [make_text(rng) for _ in range(args.size)]
+    corpus.extend([(None, []), ('', [])])
+    texts = [text for text, _ in corpus]
+
+    for label, extractor in (('legacy regex', legacy_first_key), ('access_keys', first_access_key)):
+        elapsed = timed(extractor, texts, args.repeat)
+        correct, false_matches = score(extractor, corpus)
+        print(f"{label:>12}: {elapsed / len(texts) * 1e6:6.2f} us/text, "
+              f"{correct / len(corpus):6.1%} correct, {false_matches} false or wrong keys")
+
+    all_keys = sum(len(keys) for _, keys in corpus)
+    found = sum(len(set(find_access_keys(text)) & set(keys)) for text, keys in corpus)
+    print(f"find_access_keys recovered {found}/{all_keys} keys, including texts with two keys")
+
+if __name__ == '__main__':
+    main()
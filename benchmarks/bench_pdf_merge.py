@@ -0,0 +1,128 @@
+"""Compares the standard and fast PDF merge paths of pdf_merge_routines.merge_pdfs.
+
+Usage:
+    python benchmarks/bench_pdf_merge.py [pdf_folder] [--merges N] [--repeat N]
+
+With a folder, its PDFs (e.g. real DANFE and CT-e files) are paired in order;
+without one, DANFE-like documents with text, link annotations and an outline
+are generated in a temporary folder. Each CT-e is shared by several invoices,
+as in the real merge plan, so the fast path's source cache is exercised.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pypdf import PdfReader, PdfWriter
+from pypdf.generic import (
+    ArrayObject, DecodedStreamObject, DictionaryObject, FloatObject, NameObject, NumberObject, TextStringObject
+)
+from pdf_merge_routines import merge_pdfs
+from pdf_source_cache import SourcePdfCache
+
+def _danfe_page(writer, title, lines):
+    page = writer.add_blank_page(width=595, height=842)
+    font = DictionaryObject({
+        NameObject('/Type'): NameObject('/Font'),
+        NameObject('/Subtype'): NameObject('/Type1'),
+        NameObject('/BaseFont'): NameObject('/Helvetica'),
+    })
+    page[NameObject('/Resources')] = DictionaryObject({
+        NameObject('/Font'): DictionaryObject({NameObject('/F1'): writer._add_object(font)})
+    })
+    text = [f'BT /F1 14 Tf 40 800 Td ({title}) Tj ET']
+    for i, line in enumerate(lines):
+        text.append(f'BT /F1 8 Tf 40 {780 - i * 10} Td ({line}) Tj ET')
+    text.extend(f'0.5 w 40 {700 - i * 12} m 555 {700 - i * 12} l S' for i in range(40))
+    content = DecodedStreamObject()
+    content.set_data('\n'.join(text).encode('latin-1'))
+    page[NameObject('/Contents')] = writer._add_object(content)
+
+    link = DictionaryObject({
+        NameObject('/Type'): NameObject('/Annot'),
+        NameObject('/Subtype'): NameObject('/Link'),
+        NameObject('/Rect'): ArrayObject([FloatObject(40), FloatObject(790), FloatObject(300), FloatObject(815)]),
+        NameObject('/Border'): ArrayObject([NumberObject(0), NumberObject(0), NumberObject(0)]),
+        NameObject('/A'): DictionaryObject({
+            NameObject('/S'): NameObject('/URI'),
+            NameObject('/URI'): TextStringObject('https://www.nfe.fazenda.gov.br/portal/consultaRecaptcha.aspx'),
+        }),
+    })
+    page[NameObject('/Annots')] = ArrayObject([writer._add_object(link)])
+    return page
+
+def generate_documents(folder, invoices, invoices_per_cte=4, pages=2):
+    """Write DANFE-like invoices and CT-e files, returning the (invoice, cte) pairs."""
+    pairs = []
+    cte_path = None
+    for n in range(invoices):
+        if n % invoices_per_cte == 0:
+            cte_path = os.path.join(folder, f'cte_{n // invoices_per_cte:05d}.pdf')
+            _write_document(cte_path, f'DACTE {n // invoices_per_cte}', 1)
+        invoice_path = os.path.join(folder, f'danfe_{n:05d}.pdf')
+        _write_document(invoice_path, f'DANFE {n}', pages)
+        pairs.append([invoice_path, cte_path])
+    return pairs
+
+def _write_document(path, title, pages):
+    writer = PdfWriter()
+    key = '3524 1234 5678 9012 3456 5500 1000 0012 3410 0001 2345'
+    for p in range(pages):
+        page = _danfe_page(writer, f'{title} - folha {p + 1}/{pages}', [
+            f'CHAVE DE ACESSO {key}', 'NATUREZA DA OPERACAO: VENDA DE MERCADORIA',
+            *(f'ITEM {i:03d} PRODUTO {i * 7} QTD 1,0000 VL 123,45' for i in range(30))
+        ])
+        writer.add_outline_item(f'{title} p{p + 1}', page)
+    with open(path, 'wb') as f:
+        writer.write(f)
+
+def folder_pairs(folder):
+    pdfs = sorted(os.path.join(folder, name) for name in os.listdir(folder) if name.lower().endswith('.pdf'))
+    return [pdfs[i:i + 2] for i in range(0, len(pdfs) - 1, 2)]
+
+def run(pairs, output_folder, fast):
+    cache = SourcePdfCache() if fast else None
+    start = time.perf_counter()
+    for i, pair in enumerate(pairs):
+        merge_pdfs(pair, os.path.join(output_folder, f'{"fast" if fast else "std"}_{i:05d}.pdf'), fast=fast, cache=cache)
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('pdf_folder', nargs='?', help='Folder of real PDFs to pair and merge')
+    parser.add_argument('--merges', type=int, default=200, help='Synthetic merges to generate (default: 200)')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per path; the best is reported (default: 3)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.pdf_folder:
+            pairs = folder_pairs(args.pdf_folder)
+        else:
+            source_folder = os.path.join(tmp, 'src')
+            os.makedirs(source_folder)
+            pairs = generate_documents(source_folder, args.merges)
+        output_folder = os.path.join(tmp, 'out')
+        os.makedirs(output_folder)
+        if not pairs:
+            sys.exit('No PDF pairs to merge.')
+
+        results = {}
+        for fast in (False, True):
+            results[fast] = min(run(pairs, output_folder, fast) for _ in range(args.repeat))
+
+        for i, pair in enumerate(pairs):
+            expected = sum(len(PdfReader(pdf).pages) for pdf in pair)
+            for label in ('std', 'fast'):
+                pages = len(PdfReader(os.path.join(output_folder, f'{label}_{i:05d}.pdf')).pages)
+                if pages != expected:
+                    sys.exit(f'{label} merge {i} has {pages} pages, expected {expected}')
+
+    for fast, label in ((False, 'standard'), (True, 'fast')):
+        print(f'{label:>9}: {results[fast]:.3f}s total, {results[fast] / len(pairs) * 1000:.2f} ms/merge')
+    print(f'  speedup: {results[False] / results[True]:.2f}x over {len(pairs)} merges')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+"""Times every pipeline stage over a synthetic corpus and reports throughput and peak memory.
+
+Usage:
+    python benchmarks/bench_pipeline.py [--documents N | --corpus PATH] [--workers N]
+                                        [--json results.json] [--baseline results.json]
+
+A corpus from generate_corpus.py is created in a temporary folder (or an
+existing one is used) and the stages run one at a time, in graph order, against
+scratch copies of every cache, database and Excel file. Two passes are made:
+"cold" starts from empty caches and "warm" runs again with nothing new, which
+is the cost of a typical scheduled run.
+
+Throughput uses the counters the stages record in their run metrics. Peak
+memory is how far tracemalloc saw this process's Python allocations rise above
+their level at the start of the stage; the extraction worker processes are not
+included, and --no-memory disables tracing for lower timing overhead.
+
+With --baseline, a stage more than --tolerance slower than in the saved results
+is reported as a regression and the exit status is 1.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import tracemalloc
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config_tools import DIR
+from pipeline import Pipeline
+from generate_corpus import generate
+
+# stage -> (item counter, byte counter) of its run metrics
+STAGE_COUNTERS = {
+    'scan_compras': ('files_seen', 'bytes_new'),
+    'scan_gestor': ('files_seen', 'bytes_new'),
+    'gestor': ('files', 'bytes_read'),
+    'compras': ('files', 'bytes_read'),
+    'excel': ('rows', 'bytes_written'),
+    'merge': ('merged', 'bytes_written'),
+}
+
+# Stages faster than this are not flagged as regressions; their timings are mostly noise
+NOISE_FLOOR = 0.05
+
+def corpus_config(corpus, work):
+    """Return a DIR reading the corpus and keeping every other file in the work folder."""
+    path_to = DIR()
+    documents = os.path.join(corpus, 'Documentos')
+    for key, relative_path in path_to.dirs.items():
+        path_to.dirs[key] = os.path.join(work, os.path.basename(relative_path.replace('\\', '/')))
+    path_to.dirs.update(xml_data=documents, gestor_data=documents, chNTR_data=documents, mesc=os.path.join(work, 'mesc'))
+    path_to.update_paths()
+    return path_to
+
+def run_stage(path_to, stage, args, inventory=None):
+    """Run one stage in its own pipeline and return (result dict, inventory)."""
+    pipeline = Pipeline(path_to, workers=args.workers, merge_workers=args.merge_workers, inventory=inventory)
+    if not args.no_memory:
+        tracemalloc.reset_peak()
+        allocated = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    if args.verbose:
+        status = pipeline.run([stage])[stage]
+    else:
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            status = pipeline.run([stage])[stage]
+    seconds = time.perf_counter() - start
+    peak = None if args.no_memory else tracemalloc.get_traced_memory()[1] - allocated
+
+    counters = pipeline.metrics.stage(stage).counters
+    items_counter, bytes_counter = STAGE_COUNTERS[stage]
+    items, size = counters.get(items_counter, 0), counters.get(bytes_counter, 0)
+    return {
+        'status': status,
+        'seconds': round(seconds, 4),
+        'items': items,
+        'items_per_second': round(items / seconds, 1) if seconds else None,
+        'mb_per_second': round(size / 1024 / 1024 / seconds, 2) if seconds else None,
+        'peak_mb': None if peak is None else round(peak / 1024 / 1024, 1),
+        'errors': counters.get('errors', 0),
+    }, pipeline.inventory
+
+def run_pass(path_to, args):
+    results = {}
+    inventory = None
+    for stage in Pipeline.STAGES:
+        results[stage], inventory = run_stage(path_to, stage, args, inventory)
+    return results
+
+def print_results(results, baseline=None, tolerance=0.2):
+    """Print one line per pass and stage and return the list of regressions against the baseline."""
+    regressions = []
+    print(f"{'pass':<5} {'stage':<13} {'status':<9} {'time':>9} {'items':>8} {'items/s':>10} {'MB/s':>8} {'peak MB':>8}")
+    for pass_name, stages in results.items():
+        for stage, result in stages.items():
+            line = (f"{pass_name:<5} {stage:<13} {result['status']:<9} {result['seconds']:>8.3f}s {result['items']:>8} "
+                    f"{result['items_per_second'] or 0:>10.1f} {result['mb_per_second'] or 0:>8.2f} "
+                    f"{'-' if result['peak_mb'] is None else result['peak_mb']:>8}")
+            before = (baseline or {}).get(pass_name, {}).get(stage)
+            if before:
+                change = (result['seconds'] - before['seconds']) / before['seconds'] if before['seconds'] else 0
+                line += f"  {change:+.0%}"
+                if change > tolerance and result['seconds'] >= NOISE_FLOOR:
+                    line += "  REGRESSION"
+                    regressions.append((pass_name, stage))
+            print(line)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--documents', type=int, default=1000, help='Size of the generated corpus (default: 1000)')
+    source.add_argument('--corpus', help='Existing corpus folder from generate_corpus.py')
+    parser.add_argument('--seed', type=int, default=42, help='Seed of the generated corpus (default: 42)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='XML extraction processes (default: %(default)s)')
+    parser.add_argument('--merge-workers', type=int, default=4, help='Concurrent PDF merges (default: %(default)s)')
+    parser.add_argument('--no-memory', action='store_true', help='Do not trace memory allocations')
+    parser.add_argument('--verbose', action='store_true', help='Show the output of the stages')
+    parser.add_argument('--json', help='Save the results to this file')
+    parser.add_argument('--baseline', help='Results file of an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Slowdown over the baseline reported as a regression (default: 0.2)')
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    tmp = tempfile.mkdtemp(prefix='sakana_bench_')
+    try:
+        corpus = args.corpus
+        if corpus is None:
+            corpus = os.path.join(tmp, 'corpus')
+            start = time.perf_counter()
+            generate(corpus, args.documents, seed=args.seed)
+            print(f"Generated {args.documents} documents in {time.perf_counter() - start:.1f}s")
+        with open(os.path.join(corpus, 'manifest.json')) as f:
+            manifest = json.load(f)
+        if baseline and baseline['corpus'] != manifest:
+            print("Warning: the baseline was measured on a different corpus")
+
+        path_to = corpus_config(corpus, os.path.join(tmp, 'work'))
+        if not args.no_memory:
+            tracemalloc.start()
+        results = {pass_name: run_pass(path_to, args) for pass_name in ('cold', 'warm')}
+        if not args.no_memory:
+            tracemalloc.stop()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    regressions = print_results(results, baseline and baseline['results'], args.tolerance)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'corpus': manifest,
+                'workers': args.workers,
+                'merge_workers': args.merge_workers,
+                'memory_traced': not args.no_memory,
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'results': results,
+            }, f, indent=2)
+    if regressions:
+        print(f"{len(regressions)} stage(s) slower than the baseline by more than {args.tolerance:.0%}")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
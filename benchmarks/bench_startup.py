@@ -0,0 +1,59 @@
+"""Measures how long the Sakana Tool window takes to appear, for the script or the frozen build.
+
+Usage:
+    python benchmarks/bench_startup.py [--exe dist/Sakana_Tool.exe] [--repeat N]
+
+The application is started with --measure-startup. It prints when its window
+appeared and when the background warm-up finished loading pandas, openpyxl and
+pypdf, and then closes. The wall time until it exits is also taken here, so it
+includes the interpreter start and, for the PyInstaller executable, the
+bootloader unpacking the archive. The import time of the modules the window
+needs is reported for comparison with importing every heavy module up front.
+A display is required.
+"""
+import os
+import re
+import sys
+import time
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPORT = re.compile(r'Janela exibida em ([\d.]+)s; bibliotecas carregadas em ([\d.]+)s')
+
+def import_time(statement):
+    """Return the seconds a fresh interpreter takes to run the import statement."""
+    command = [sys.executable, '-c', f'import time; t = time.perf_counter(); {statement}; print(time.perf_counter() - t)']
+    return float(subprocess.run(command, cwd=ROOT, capture_output=True, text=True, check=True).stdout)
+
+def launch(command, timeout):
+    """Start the application once; return (window seconds, libraries seconds, process seconds)."""
+    start = time.perf_counter()
+    result = subprocess.run(command, cwd=ROOT, capture_output=True, text=True, timeout=timeout)
+    elapsed = time.perf_counter() - start
+    match = REPORT.search(result.stdout)
+    if not match:
+        sys.exit(f"No startup report from {' '.join(command)}:\n{result.stdout}{result.stderr}")
+    return float(match.group(1)), float(match.group(2)), elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--exe', help='Frozen executable to measure instead of Sakana_Tool.py')
+    parser.add_argument('--repeat', type=int, default=5, help='Launches; the median is reported (default: 5)')
+    parser.add_argument('--timeout', type=float, default=120, help='Seconds to wait for each launch (default: 120)')
+    args = parser.parse_args()
+
+    command = [args.exe] if args.exe else [sys.executable, os.path.join(ROOT, 'Sakana_Tool.py')]
+    runs = sorted(launch(command + ['--measure-startup'], args.timeout) for _ in range(args.repeat))
+    window, libraries, process = (sorted(values)[len(values) // 2] for values in zip(*runs))
+
+    print(f"{'executable' if args.exe else 'script'}: median of {args.repeat} launches")
+    print(f"  window shown:          {window:.2f}s after the module started")
+    print(f"  libraries warmed up:   {libraries:.2f}s after the module started")
+    print(f"  launch to exit:        {process:.2f}s (interpreter or bootloader included)")
+    if not args.exe:
+        print(f"  import for the window: {import_time('import Sakana_Tool'):.2f}s")
+        print(f"  import everything:     {import_time('import Sakana_Tool, pipeline; pipeline.warm_up()'):.2f}s")
+
+if __name__ == '__main__':
+    main()
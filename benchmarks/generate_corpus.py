@@ -0,0 +1,241 @@
+"""Generates a synthetic GestorDFe document tree for offline benchmarks.
+
+Usage:
+    python benchmarks/generate_corpus.py OUTPUT [--documents N] [--files-per-dir N] [--seed N]
+
+OUTPUT/Documentos mirrors the shared drive: one folder per emitter CNPJ, year
+and month, holding nfe-namespaced procNFe XMLs named after their access key,
+the matching DANFE PDFs, "-procEvento" event XMLs with their CCe PDFs in a
+"CCe" subfolder, and an "Auditoria" folder the merge must ignore.
+
+Each referenced NF-e is cited by one to three purchase NF-e documents whose
+infCpl quotes its key (whole, grouped in fours, dotted or surrounded by other
+numbers; a few quote no key at all) and whose DANFE is named "<key>-nfe.pdf",
+so a full pipeline run over the tree produces real Excel rows and PDF merges.
+Item (det) counts follow a long tail, from 1 to --max-det.
+
+Only the standard library is used; the same seed always gives the same tree.
+Scales from 1k to 1M documents are supported; OUTPUT/manifest.json records
+what was generated.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+from xml.sax.saxutils import escape
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from access_keys import check_digit
+
+NFE_NAMESPACE = 'http://www.portalfiscal.inf.br/nfe'
+UF_CODES = {'35': 'SP', '33': 'RJ', '31': 'MG', '41': 'PR', '42': 'SC', '43': 'RS', '29': 'BA', '52': 'GO'}
+MUNICIPIOS = ['Sao Paulo', 'Campinas', 'Santos', 'Rio de Janeiro', 'Belo Horizonte', 'Curitiba', 'Joinville',
+              'Porto Alegre', 'Salvador', 'Goiania', 'Ribeirao Preto', 'Sorocaba']
+FANTASIAS = ['ALFA DISTRIBUIDORA', 'BETA ALIMENTOS', 'GAMA TRANSPORTES', 'DELTA INSUMOS', 'EPSILON AGRO',
+             'ZETA LOGISTICA', 'ETA EMBALAGENS', 'TETA QUIMICA', 'IOTA METAIS', 'KAPA PAPEIS']
+
+def access_key(rng, uf, year, month, cnpj, number):
+    body = f"{uf}{year % 100:02d}{month:02d}{cnpj}55001{number:09d}1{rng.randrange(10**8):08d}"
+    return body + str(check_digit(body))
+
+def cnpj(rng):
+    return f"{rng.randrange(10**8):08d}0001{rng.randrange(100):02d}"
+
+def infcpl_text(rng, referenced_key):
+    """Free-text additional information quoting the referenced key in one of the usual ways."""
+    order = f"PEDIDO {rng.randrange(10**9, 10**10)}"
+    style = rng.random()
+    if referenced_key is None or style < 0.04:
+        return f"DOCUMENTO EMITIDO POR ME OU EPP OPTANTE PELO SIMPLES NACIONAL. {order}"
+    if style < 0.55:
+        return f"REF NF-e {referenced_key} {order}"
+    if style < 0.75:
+        grouped = ' '.join(referenced_key[i:i + 4] for i in range(0, 44, 4))
+        return f"CHAVE DE ACESSO DA NF-e DE ORIGEM: {grouped}. {order}"
+    if style < 0.85:
+        dotted = '.'.join(referenced_key[i:i + 4] for i in range(0, 44, 4))
+        return f"NFe origem {dotted} - Fone (11) 9{rng.randrange(10**7, 10**8)}"
+    return f"{order}; NFe{referenced_key}; Valor aprox. tributos R$ {rng.randrange(1, 999)},{rng.randrange(100):02d}"
+
+def item_count(rng, max_det):
+    """Number of det items: most invoices carry a handful, a few carry hundreds."""
+    return max(1, min(max_det, int(rng.paretovariate(1.2))))
+
+def procnfe_xml(rng, key, number, issued, emitter, fantasia, municipio, max_det, infcpl):
+    items = []
+    total = 0.0
+    for n in range(1, item_count(rng, max_det) + 1):
+        value = round(rng.uniform(1, 5000), 2)
+        total += value
+        items.append(
+            f'<det nItem="{n}"><prod><cProd>{rng.randrange(10**6):06d}</cProd><cEAN>SEM GTIN</cEAN>'
+            f'<xProd>PRODUTO {n} LOTE {rng.randrange(10**4)}</xProd><NCM>{rng.randrange(10**8):08d}</NCM>'
+            f'<CFOP>5102</CFOP><uCom>UN</uCom><qCom>1.0000</qCom><vUnCom>{value:.2f}</vUnCom>'
+            f'<vProd>{value:.2f}</vProd></prod><imposto><ICMS><ICMS00><orig>0</orig><CST>00</CST>'
+            f'<vBC>{value:.2f}</vBC><pICMS>18.00</pICMS><vICMS>{value * 0.18:.2f}</vICMS></ICMS00></ICMS></imposto></det>'
+        )
+    infadic = f'<infAdic><infCpl>{escape(infcpl)}</infCpl></infAdic>' if infcpl is not None else ''
+    return (
+        f'<?xml version="1.0" encoding="UTF-8"?>'
+        f'<nfeProc xmlns="{NFE_NAMESPACE}" versao="4.00"><NFe><infNFe Id="NFe{key}" versao="4.00">'
+        f'<ide><cUF>{key[:2]}</cUF><natOp>VENDA DE MERCADORIA</natOp><mod>55</mod><serie>1</serie>'
+        f'<nNF>{number}</nNF><dhEmi>{issued}</dhEmi><tpNF>1</tpNF></ide>'
+        f'<emit><CNPJ>{emitter}</CNPJ><xNome>{fantasia} LTDA</xNome><xFant>{fantasia}</xFant>'
+        f'<enderEmit><xMun>{MUNICIPIOS[int(emitter[:2]) % len(MUNICIPIOS)]}</xMun></enderEmit></emit>'
+        f'<dest><CNPJ>02334933000140</CNPJ><xNome>DESTINATARIO</xNome>'
+        f'<enderDest><xMun>{municipio}</xMun><UF>{UF_CODES[key[:2]]}</UF></enderDest></dest>'
+        + ''.join(items) +
+        f'<total><ICMSTot><vBC>{total:.2f}</vBC><vICMS>{total * 0.18:.2f}</vICMS><vProd>{total:.2f}</vProd>'
+        f'<vNF>{total:.2f}</vNF></ICMSTot></total>{infadic}</infNFe></NFe>'
+        f'<protNFe versao="4.00"><infProt><tpAmb>1</tpAmb><chNFe>{key}</chNFe>'
+        f'<dhRecbto>{issued}</dhRecbto><nProt>1{rng.randrange(10**14):014d}</nProt><cStat>100</cStat>'
+        f'</infProt></protNFe></nfeProc>'
+    )
+
+def proc_evento_xml(key, issued):
+    return (
+        f'<?xml version="1.0" encoding="UTF-8"?>'
+        f'<procEventoNFe xmlns="{NFE_NAMESPACE}" versao="1.00"><evento versao="1.00">'
+        f'<infEvento Id="ID110110{key}01"><chNFe>{key}</chNFe><dhEvento>{issued}</dhEvento>'
+        f'<tpEvento>110110</tpEvento><nSeqEvento>1</nSeqEvento><detEvento versao="1.00">'
+        f'<descEvento>Carta de Correcao</descEvento><xCorrecao>Correcao do endereco de entrega</xCorrecao>'
+        f'</detEvento></infEvento></evento></procEventoNFe>'
+    )
+
+def minimal_pdf(lines):
+    """Return the bytes of a one-page PDF showing the text lines, with a valid xref table."""
+    text = ''.join(
+        f"BT /F1 9 Tf 40 {800 - i * 12} Td ({line.replace('(', '[').replace(')', ']')}) Tj ET\n"
+        for i, line in enumerate(lines)
+    ).encode('latin-1')
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] '
+        b'/Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>',
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+        b'<< /Length %d >>\nstream\n%sendstream' % (len(text), text),
+    ]
+    pdf = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += b'%d 0 obj\n%s\nendobj\n' % (number, body)
+    xref = len(pdf)
+    pdf += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    pdf += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    pdf += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    return bytes(pdf)
+
+class CorpusWriter:
+    """Writes documents into folders of at most files_per_dir XMLs, laid out as CNPJ/year/month."""
+
+    def __init__(self, root, rng, files_per_dir, emitters=20):
+        self.documents = os.path.join(root, 'Documentos')
+        self.rng = rng
+        self.files_per_dir = files_per_dir
+        self.emitters = [cnpj(rng) for _ in range(emitters)]
+        self.fantasias = {emitter: rng.choice(FANTASIAS) for emitter in self.emitters}
+        self.counts = {'xml': 0, 'event_xml': 0, 'pdf': 0, 'cce_pdf': 0, 'audit_pdf': 0, 'bytes': 0}
+        self._folder = None
+
+    def folder_for(self, index):
+        """Return (folder, emitter, year, month) of the index-th XML."""
+        bucket = index // self.files_per_dir
+        emitter = self.emitters[bucket % len(self.emitters)]
+        month = (bucket // len(self.emitters)) % 12 + 1
+        year = 2023 + bucket // (len(self.emitters) * 12)
+        folder = os.path.join(self.documents, emitter, str(year), f'{month:02d}')
+        if folder != self._folder:
+            os.makedirs(folder, exist_ok=True)
+            self._folder = folder
+        return folder, emitter, year, month
+
+    def write(self, path, data, kind):
+        mode = 'wb' if isinstance(data, bytes) else 'w'
+        with open(path, mode, **({} if mode == 'wb' else {'encoding': 'utf-8'})) as f:
+            f.write(data)
+        self.counts[kind] += 1
+        self.counts['bytes'] += len(data)
+
+    def document(self, index, referenced_key, max_det, with_pdf=True, pdf_suffix=''):
+        """Write one procNFe XML (and its DANFE) and return its key."""
+        folder, emitter, year, month = self.folder_for(index)
+        rng = self.rng
+        number = index + 1
+        key = access_key(rng, rng.choice(list(UF_CODES)), year, month, emitter, number)
+        issued = f"{year}-{month:02d}-{rng.randint(1, 28):02d}T{rng.randint(7, 18):02d}:{rng.randint(0, 59):02d}:00-03:00"
+        # A few documents carry no infAdic at all
+        infcpl = None if rng.random() < 0.02 else infcpl_text(rng, referenced_key)
+        xml = procnfe_xml(rng, key, number, issued, emitter, self.fantasias[emitter],
+                          rng.choice(MUNICIPIOS), max_det, infcpl)
+        self.write(os.path.join(folder, f'{key}.xml'), xml, 'xml')
+        if with_pdf:
+            self.write(os.path.join(folder, f'{key}{pdf_suffix}.pdf'),
+                       minimal_pdf([f'DANFE NF-e {number}', f'CHAVE DE ACESSO {key}', f'EMITENTE {emitter}']), 'pdf')
+        return key, folder, issued
+
+    def correction(self, key, folder, issued):
+        """Write a CCe event XML and its PDF in the CCe subfolder."""
+        self.write(os.path.join(folder, f'{key}_110110_01-procEventoNFe.xml'), proc_evento_xml(key, issued), 'event_xml')
+        cce_folder = os.path.join(folder, 'CCe')
+        os.makedirs(cce_folder, exist_ok=True)
+        self.write(os.path.join(cce_folder, f'{key}.pdf'), minimal_pdf(['CARTA DE CORRECAO', f'CHAVE {key}']), 'cce_pdf')
+
+    def audit_copy(self, key):
+        folder = os.path.join(self.documents, 'Auditoria')
+        os.makedirs(folder, exist_ok=True)
+        self.write(os.path.join(folder, f'{key}.pdf'), minimal_pdf(['COPIA DE AUDITORIA', key]), 'audit_pdf')
+
+def generate(root, documents, files_per_dir=250, max_det=300, seed=42):
+    """Generate the tree under root and return the manifest dict."""
+    rng = random.Random(seed)
+    writer = CorpusWriter(root, rng, files_per_dir)
+    references = 0
+    index = 0
+    while index < documents:
+        # The referenced NF-e, whose DANFE is file1 of the merge; a few DANFEs are missing
+        referenced_key, folder, issued = writer.document(index, None, max_det, with_pdf=rng.random() >= 0.03)
+        index += 1
+        if rng.random() < 0.05:
+            writer.correction(referenced_key, folder, issued)
+        if rng.random() < 0.01:
+            writer.audit_copy(referenced_key)
+        # The purchases quoting it, whose "-nfe" DANFEs are file2 of the merge
+        for _ in range(rng.randint(1, 3)):
+            if index >= documents:
+                break
+            writer.document(index, referenced_key, max_det, pdf_suffix='-nfe')
+            references += 1
+            index += 1
+
+    manifest = {
+        'documents': documents, 'seed': seed, 'files_per_dir': files_per_dir, 'max_det': max_det,
+        'purchases': references, **writer.counts,
+    }
+    with open(os.path.join(root, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('output', help='Folder to create the corpus in')
+    parser.add_argument('--documents', type=int, default=1000, help='NF-e XMLs to generate (default: 1000)')
+    parser.add_argument('--files-per-dir', type=int, default=250, help='XMLs per month folder (default: 250)')
+    parser.add_argument('--max-det', type=int, default=300, help='Most det items in one invoice (default: 300)')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed (default: 42)')
+    args = parser.parse_args()
+
+    if os.path.exists(os.path.join(args.output, 'Documentos')):
+        sys.exit(f'{args.output} already holds a corpus.')
+    start = time.perf_counter()
+    manifest = generate(args.output, args.documents, args.files_per_dir, args.max_det, args.seed)
+    print(f"{manifest['xml']} NF-e XMLs, {manifest['event_xml']} events, "
+          f"{manifest['pdf'] + manifest['cce_pdf'] + manifest['audit_pdf']} PDFs, "
+          f"{manifest['bytes'] / 1024 / 1024:.1f} MB in {time.perf_counter() - start:.1f}s")
+
+if __name__ == '__main__':
+    main()
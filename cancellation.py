@@ -0,0 +1,27 @@
+import threading
+
+class Cancelled(Exception):
+    """Raised at a checkpoint of a stage after its CancelToken was cancelled."""
+
+class CancelToken:
+    """Flag asking the running stages to stop at their next checkpoint.
+
+    cancel() may be called from any thread, e.g. the GUI or a signal handler.
+    Stages call check() between units of work (files, chunks, merges) after
+    saving what they finished, so the next run resumes from there.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def check(self):
+        """Raise Cancelled if cancel() was called."""
+        if self._event.is_set():
+            raise Cancelled("Execução cancelada")
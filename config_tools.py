@@ -30,14 +30,20 @@ class DIR:
             'json_object': './root/object.json',
             
             'merged_files_json':'./data/cache_data/merged_files.json',
-            'execution_log_csv':'./data/cache_data/execution_log.csv',
+            'merged_files_db':'./data/cache_data/merged_files.db',
+            'run_metrics':'./data/cache_data/run_metrics.jsonl',
+            'app_log':'./data/logs/sakana_tool.log',
 
             'cache_compras':'./data/cache_data/cache_compras.csv',
             'cache_gestor':'./root/data/cache_data/cache_gestor.csv',
+            'scan_state':'./data/cache_data/scan_state.json',
+            'pdf_index_db':'./data/cache_data/pdf_index.db',
             
             'new_compras':'./data/cache_data/new_compras.csv',
             'new_gestor':'./data/cache_data/new_gestor.csv',
 
+            'records_db':'./data/cache_data/records.db',
+
             'xl_compras':'./data/xlsx_data/xl_compras.xlsx',
             'xl_gestor':'./data/xlsx_data/xl_gestor.xlsx',
             'xl_combi':'./data/xlsx_data/xl_combinada.xlsx',  # Removed redundant key
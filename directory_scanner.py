@@ -0,0 +1,295 @@
+import os
+import json
+import time
+import queue
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+class FileEntry(namedtuple('FileEntry', ['path', 'name', 'st_size', 'st_mtime_ns'])):
+    """File found by the scanner; exposes the stat fields used by CacheCreator."""
+
+    __slots__ = ()
+
+    @property
+    def st_mtime(self):
+        # Same float os.stat() reports, so ISO timestamps match the ones built from getmtime()
+        seconds, nanoseconds = divmod(self.st_mtime_ns, 10**9)
+        return seconds + nanoseconds * 1e-9
+
+class DirectoryScanner:
+    """Walks a directory tree with os.scandir, reading subdirectories concurrently.
+
+    The listing of every directory is kept in a JSON state file together with the
+    directory's mtime. On the next scan a directory whose mtime has not changed is
+    not listed again and its cached files are reported instead, which turns a
+    round-trip per file on network mounts into one stat per unchanged directory.
+    Adding, removing or renaming a file updates its directory's mtime; rewriting a
+    file in place does not, so pruning can be disabled when that matters.
+    """
+
+    def __init__(self, directory, state_file=None, max_workers=8, prune_unchanged=True):
+        self.directory = os.path.abspath(directory)
+        self.state_file = state_file
+        self.max_workers = max_workers
+        self.prune_unchanged = prune_unchanged
+        self.state = self.load_state()
+        self.stats = {'listed': 0, 'pruned': 0, 'errors': 0}
+        # Set when a walk changes the state; save_state() writes nothing otherwise
+        self.changed = False
+
+    def load_state(self):
+        """Load the cached directory listings from the state file."""
+        if self.state_file and os.path.exists(self.state_file):
+            try:
+                with open(self.state_file, 'r') as f:
+                    return json.load(f)
+            except Exception as e:
+                print(f"Error loading scan state: {e}")
+        return {}
+
+    def save_state(self):
+        """Save the cached directory listings to the state file if a walk changed them.
+
+        A walk that reused every cached listing leaves the file untouched, so polling
+        an unchanged tree does not rewrite it.
+        """
+        if not self.state_file or not self.changed:
+            return
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.state_file)), exist_ok=True)
+            with open(self.state_file, 'w') as f:
+                json.dump(self.state, f)
+            self.changed = False
+        except Exception as e:
+            print(f"Error saving scan state: {e}")
+
+    def _read_dir(self, dir_path, mtime_ns=None):
+        """List one directory, or return its cached listing if its mtime is unchanged."""
+        try:
+            if mtime_ns is None:
+                mtime_ns = os.stat(dir_path).st_mtime_ns
+            cached = self.state.get(dir_path)
+            if self.prune_unchanged and cached and cached['mtime_ns'] == mtime_ns:
+                return dir_path, cached, True
+
+            subdirs = []
+            files = []
+            with os.scandir(dir_path) as entries:
+                for entry in entries:
+                    # DirEntry.stat() reuses the data returned by the listing on Windows
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append([entry.name, entry.stat(follow_symlinks=False).st_mtime_ns])
+                    elif entry.is_file():
+                        stat_result = entry.stat()
+                        files.append([entry.name, stat_result.st_size, stat_result.st_mtime_ns])
+            return dir_path, {'mtime_ns': mtime_ns, 'subdirs': subdirs, 'files': files}, False
+        except OSError as e:
+            print(f"Error scanning directory {dir_path}: {e}")
+            return dir_path, None, False
+
+    def iter_files(self, directory=None):
+        """Yield a FileEntry for every file under the directory as each directory is read.
+
+        :param directory: Tree to walk instead of the scanner's own directory.
+        """
+        directory = os.path.abspath(directory) if directory else self.directory
+        self.stats = {'listed': 0, 'pruned': 0, 'errors': 0}
+        visited = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = {executor.submit(self._read_dir, directory)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    dir_path, listing, pruned = future.result()
+                    if listing is None:
+                        self.stats['errors'] += 1
+                        continue
+                    visited[dir_path] = listing
+                    self.stats['pruned' if pruned else 'listed'] += 1
+
+                    for name, mtime_ns in listing['subdirs']:
+                        # Subdirectory mtimes are only fresh when the parent was actually listed
+                        pending.add(executor.submit(
+                            self._read_dir, os.path.join(dir_path, name), None if pruned else mtime_ns
+                        ))
+                    for name, size, mtime_ns in listing['files']:
+                        yield FileEntry(os.path.join(dir_path, name), name, size, mtime_ns)
+
+        # Replace the state of this tree only, keeping listings cached for other roots
+        prefix = os.path.join(directory, '')
+        previous = {path for path in self.state if path == directory or path.startswith(prefix)}
+        # A reused listing is the cached one; only new listings or removed directories change the state
+        if self.stats['listed'] or previous != visited.keys():
+            self.changed = True
+        self.state = {
+            path: listing for path, listing in self.state.items()
+            if path != directory and not path.startswith(prefix)
+        }
+        self.state.update(visited)
+
+    def scan(self, directory=None):
+        """Return every FileEntry under the directory, sorted by path."""
+        return sorted(self.iter_files(directory))
+
+class FileInventory:
+    """Listing of every file under a set of folders, built with a single walk per folder.
+
+    The XML scans and the PDF merge all read the same GestorDFe tree; building one
+    inventory per pipeline run and handing it to each stage replaces one full
+    traversal per stage. Folders that are equal to, or nested in, another one are
+    only walked once.
+    """
+
+    def __init__(self, directories, state_file=None, max_workers=8, prune_unchanged=True):
+        self.roots = []
+        for directory in sorted({os.path.abspath(d) for d in directories}, key=len):
+            if not any(self._is_within(directory, root) for root in self.roots):
+                self.roots.append(directory)
+        self.scanner = DirectoryScanner(self.roots[0], state_file, max_workers, prune_unchanged)
+        self.entries = {}
+        self.stats = {'listed': 0, 'pruned': 0, 'errors': 0}
+
+    @staticmethod
+    def _is_within(path, root):
+        return path == root or path.startswith(os.path.join(root, ''))
+
+    def covers(self, path):
+        """Return True if the path is inside one of the inventory's root folders."""
+        path = os.path.abspath(path)
+        return any(self._is_within(path, root) for root in self.roots)
+
+    def build(self, verbose=True):
+        """Walk every root folder once and save the scan state.
+
+        :param verbose: Print a summary of the walk.
+        """
+        for _ in self.walk(verbose):
+            pass
+        return self
+
+    def walk(self, verbose=True):
+        """Yield every FileEntry of the root folders as each directory is read.
+
+        Once the generator is exhausted the inventory is filled and the scan state
+        saved, as by build(); a walk stopped early saves nothing.
+        """
+        for root in self.roots:
+            entries = []
+            for entry in self.scanner.iter_files(root):
+                entries.append(entry)
+                yield entry
+            self.entries[root] = sorted(entries)
+            for key, value in self.scanner.stats.items():
+                self.stats[key] += value
+        self.scanner.save_state()
+        if verbose:
+            print(f"Inventory: {sum(len(e) for e in self.entries.values())} files, "
+                  f"{self.stats['listed']} directories listed, {self.stats['pruned']} unchanged listings reused.")
+
+    def directories(self, root):
+        """Yield (dir_path, mtime_ns, files) for every directory listed under a root folder.
+
+        files holds [name, size, mtime_ns] items, as stored in the scan state.
+        """
+        if root not in self.entries:
+            self.build()
+        for dir_path, listing in self.scanner.state.items():
+            if self._is_within(dir_path, root):
+                yield dir_path, listing['mtime_ns'], listing['files']
+
+    def files(self, directory, extension=None):
+        """Return the FileEntry list under the directory, optionally filtered by extension.
+
+        :param extension: Case-insensitive suffix such as '.xml'.
+        """
+        directory = os.path.abspath(directory)
+        root = next((r for r in self.roots if self._is_within(directory, r)), None)
+        if root is None:
+            raise ValueError(f"Directory not covered by the inventory: {directory}")
+        if root not in self.entries:
+            self.build()
+
+        entries = self.entries[root]
+        if directory != root:
+            prefix = os.path.join(directory, '')
+            entries = [e for e in entries if e.path.startswith(prefix)]
+        if extension:
+            extension = extension.lower()
+            entries = [e for e in entries if e.name.lower().endswith(extension)]
+        return entries
+
+class SharedWalk:
+    """One FileInventory walk, run in a background thread and fanned out to several readers.
+
+    Each reader registered with a folder gets the files under it as the walk
+    finds them, through files(), the same call FileInventory offers; the walk
+    goes on regardless of how fast each reader takes its files. Once it is done,
+    wait() returns the completed inventory, so the scans and later stages of a
+    run share a single traversal even when the scans start before it ends.
+    """
+
+    def __init__(self, inventory, directories, cancel=None):
+        """
+        :param inventory: FileInventory that is walked and filled.
+        :param directories: Folder of each reader; a folder listed twice is read twice.
+        :param cancel: Optional CancelToken; a cancelled walk raises Cancelled in the readers.
+        """
+        self.inventory = inventory
+        self.cancel = cancel
+        self._feeds = [(os.path.join(os.path.abspath(d), ''), queue.SimpleQueue()) for d in directories]
+        self._claimed = set()
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self.error = None
+        self.seconds = None
+
+    def start(self, verbose=True):
+        threading.Thread(target=self._walk, args=(verbose,), daemon=True).start()
+        return self
+
+    def _walk(self, verbose):
+        start = time.perf_counter()
+        try:
+            for entry in self.inventory.walk(verbose):
+                if self.cancel is not None:
+                    self.cancel.check()
+                for prefix, feed in self._feeds:
+                    if entry.path.startswith(prefix):
+                        feed.put(entry)
+        except BaseException as e:
+            self.error = e
+        finally:
+            self.seconds = time.perf_counter() - start
+            for _, feed in self._feeds:
+                feed.put(None)
+            self._done.set()
+
+    def files(self, directory, extension=None):
+        """Yield the FileEntry objects under a registered folder as the walk finds them.
+
+        :param extension: Case-insensitive suffix such as '.xml'.
+        """
+        prefix = os.path.join(os.path.abspath(directory), '')
+        with self._lock:
+            index = next((i for i, (p, _) in enumerate(self._feeds) if p == prefix and i not in self._claimed), None)
+            if index is None:
+                raise ValueError(f"Directory not registered with the walk, or already read: {directory}")
+            self._claimed.add(index)
+        feed = self._feeds[index][1]
+        extension = extension.lower() if extension else None
+        while True:
+            entry = feed.get()
+            if entry is None:
+                break
+            if extension is None or entry.name.lower().endswith(extension):
+                yield entry
+        if self.error is not None:
+            raise self.error
+
+    def wait(self):
+        """Block until the walk is done and return the filled FileInventory."""
+        self._done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.inventory
@@ -0,0 +1,64 @@
+import os
+import queue
+import logging
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(name)s - %(message)s'
+
+logger = logging.getLogger('sakana')
+
+def configure_logging(log_file, level=logging.INFO, max_bytes=5 * 1024 * 1024, backup_count=5):
+    """Send the records of every logger to a rotating log file.
+
+    Records are put on a queue by the thread that logs them and written by a
+    listener thread, so workers never wait on the file (often on a synced drive).
+
+    :return: The started QueueListener; stop() it on exit to flush the queue.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+    file_handler = RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    records = queue.SimpleQueue()
+    listener = QueueListener(records, file_handler, respect_handler_level=True)
+    listener.start()
+
+    root = logging.getLogger()
+    root.addHandler(QueueHandler(records))
+    root.setLevel(level)
+    return listener
+
+class EventSink:
+    """PipelineEvents put from any thread without blocking and taken in batches by the Tk thread.
+
+    Log messages, stage failures and stage transitions are also written to the
+    'sakana' logger, i.e. to the rotating log file when configure_logging is used.
+    """
+
+    def __init__(self):
+        self._events = queue.SimpleQueue()
+
+    def put(self, event):
+        if event.kind == 'log':
+            logger.info(event.data)
+        elif event.kind == 'stage_failed':
+            logger.error(f"Stage {event.stage} failed: {event.data}")
+        elif event.kind.startswith('stage_'):
+            logger.info(f"Stage {event.stage} {event.kind[len('stage_'):]}")
+        self._events.put(event)
+
+    def drain(self, max_events=500):
+        """Return up to max_events queued events, in order, keeping only the last progress event."""
+        events = []
+        progress = None
+        while len(events) < max_events:
+            try:
+                event = self._events.get_nowait()
+            except queue.Empty:
+                break
+            if event.kind == 'progress':
+                progress = event
+            else:
+                events.append(event)
+        if progress is not None:
+            events.append(progress)
+        return events
@@ -0,0 +1,71 @@
+import os
+import json
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+class MergeLedger:
+    """Append-only record of the merged PDF outputs, committed one merge at a time.
+
+    Replaces the merged_files.json list: membership checks use an in-memory set
+    and every successful merge is committed as soon as it finishes, so a run that
+    is interrupted resumes without redoing the merges it already completed.
+    """
+
+    def __init__(self, db_path, legacy_json=None):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        with self._conn:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS merged '
+                '(output_filename TEXT PRIMARY KEY, output_path TEXT, source_keys TEXT, fingerprint TEXT, merged_at TEXT)'
+            )
+        self.merged = {row[0] for row in self._conn.execute('SELECT output_filename FROM merged')}
+        if not self.merged and legacy_json:
+            self.import_json(legacy_json)
+
+    def import_json(self, json_file):
+        """Import the output names of a legacy merged_files.json list."""
+        if not os.path.exists(json_file):
+            return 0
+        with open(json_file, 'r') as f:
+            names = json.load(f)
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO merged (output_filename) VALUES (?)', [(name,) for name in names]
+            )
+            imported = self._conn.total_changes - before
+        self.merged.update(names)
+        logger.info(f"Imported {imported} merged files from {json_file}")
+        return imported
+
+    def __contains__(self, output_filename):
+        return output_filename in self.merged
+
+    def __len__(self):
+        return len(self.merged)
+
+    def record(self, output_filename, output_path, source_keys, fingerprint):
+        """Commit one finished merge.
+
+        :param source_keys: Access keys of the merged documents.
+        :param fingerprint: Content hash of the written output.
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO merged (output_filename, output_path, source_keys, fingerprint, merged_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (output_filename, output_path, json.dumps(list(source_keys)), fingerprint,
+                 datetime.now().isoformat(timespec='seconds'))
+            )
+            self.merged.add(output_filename)
+
+    def close(self):
+        self._conn.close()
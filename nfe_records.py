@@ -0,0 +1,80 @@
+import re
+
+_NON_DIGITS = re.compile(r'\D')
+
+def parse_int(text):
+    """Return the integer in text, or None when it is missing or malformed."""
+    try:
+        return int(text.strip())
+    except (AttributeError, ValueError):
+        return None
+
+def parse_float(text):
+    """Return the decimal number in text (e.g. vProd "1234.56"), or None when it is missing or malformed."""
+    try:
+        return float(text.strip())
+    except (AttributeError, ValueError):
+        return None
+
+def parse_year(text):
+    """Return the year of an ISO date such as dhEmi "2024-03-01T10:00:00-03:00"."""
+    return parse_int(text[:4]) if text else None
+
+def normalize_key(text):
+    """Return an access key as its 44 digits, dropping spaces and punctuation.
+
+    Values that do not hold exactly 44 digits are returned unchanged.
+    """
+    if not text:
+        return text or None
+    digits = _NON_DIGITS.sub('', text)
+    return digits if len(digits) == 44 else text
+
+class _Record:
+    """Fixed set of typed fields, iterable in column order like the tuple it replaces."""
+
+    __slots__ = ()
+
+    def __iter__(self):
+        return (getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and tuple(self) == tuple(other)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__)})"
+
+class GestorRecord(_Record):
+    """Values extracted from a Gestor XML; chNTR is the file name, the key of the record."""
+
+    __slots__ = ('chNTR', 'nNF', 'dhEmi', 'xFant')
+
+    def __init__(self, chNTR, nNF, dhEmi, xFant):
+        self.chNTR = chNTR
+        self.nNF = nNF
+        self.dhEmi = dhEmi
+        self.xFant = xFant
+
+    @classmethod
+    def from_text(cls, chNTR, nNF, dhEmi, xFant):
+        """Build the record from the XML text values, parsing nNF and the dhEmi year."""
+        return cls(chNTR, parse_int(nNF), parse_year(dhEmi), xFant)
+
+class ComprasRecord(_Record):
+    """Values extracted from a purchase XML; file_name is the key of the record."""
+
+    __slots__ = ('file_name', 'chNF', 'chNTR', 'xMun', 'vProd')
+
+    def __init__(self, file_name, chNF, chNTR, xMun, vProd):
+        self.file_name = file_name
+        self.chNF = chNF
+        self.chNTR = chNTR
+        self.xMun = xMun
+        self.vProd = vProd
+
+    @classmethod
+    def from_text(cls, file_name, chNF, chNTR, xMun, vProd):
+        """Build the record from the XML text values, normalizing the keys and parsing vProd."""
+        return cls(file_name, normalize_key(chNF), normalize_key(chNTR), xMun, parse_float(vProd))
+
+RECORD_TYPES = {'gestor': GestorRecord, 'compras': ComprasRecord}
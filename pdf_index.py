@@ -0,0 +1,90 @@
+import os
+import sqlite3
+import logging
+from contextlib import closing
+from directory_scanner import FileEntry
+
+logger = logging.getLogger(__name__)
+
+class PdfIndex:
+    """Persistent index of the PDF files found under the document folders.
+
+    Rows are grouped by directory and a directory is only re-indexed when its
+    mtime in the scan inventory differs from the one stored, so a run with no new
+    documents touches nothing but the directory table.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS dirs (dir TEXT PRIMARY KEY, mtime_ns INTEGER)')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS pdf_files '
+                '(path TEXT PRIMARY KEY, dir TEXT, name TEXT, size INTEGER, mtime_ns INTEGER)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS pdf_files_dir ON pdf_files (dir)')
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def clear(self):
+        """Empty the index, so the next refresh indexes every directory again.
+
+        Emptying the tables in place, rather than deleting the database file,
+        leaves no -wal/-shm files behind to be replayed against a new database.
+        """
+        with closing(self._connect()) as conn, conn:
+            conn.execute('DELETE FROM pdf_files')
+            conn.execute('DELETE FROM dirs')
+        logger.info(f"PDF index cleared: {self.db_path}")
+
+    def refresh(self, inventory):
+        """Bring the index up to date with the directories listed in a FileInventory.
+
+        :return: Number of directories re-indexed or dropped.
+        """
+        changed = 0
+        with closing(self._connect()) as conn, conn:
+            stored = dict(conn.execute('SELECT dir, mtime_ns FROM dirs'))
+            seen = set()
+            for root in inventory.roots:
+                for dir_path, mtime_ns, files in inventory.directories(root):
+                    seen.add(dir_path)
+                    if stored.get(dir_path) == mtime_ns:
+                        continue
+                    conn.execute('DELETE FROM pdf_files WHERE dir = ?', (dir_path,))
+                    conn.executemany(
+                        'INSERT OR REPLACE INTO pdf_files (path, dir, name, size, mtime_ns) VALUES (?, ?, ?, ?, ?)',
+                        [(os.path.join(dir_path, name), dir_path, name, size, file_mtime_ns)
+                         for name, size, file_mtime_ns in files if name.endswith('.pdf')]
+                    )
+                    conn.execute('INSERT OR REPLACE INTO dirs (dir, mtime_ns) VALUES (?, ?)', (dir_path, mtime_ns))
+                    changed += 1
+
+            # Directories that were removed from the scanned folders
+            for dir_path in stored.keys() - seen:
+                if inventory.covers(dir_path):
+                    conn.execute('DELETE FROM pdf_files WHERE dir = ?', (dir_path,))
+                    conn.execute('DELETE FROM dirs WHERE dir = ?', (dir_path,))
+                    changed += 1
+        logger.info(f"PDF index: {changed} directories updated.")
+        return changed
+
+    def files(self, directory, extension=None):
+        """Return the indexed FileEntry list under the directory, like FileInventory.files."""
+        directory = os.path.abspath(directory)
+        prefix = os.path.join(directory, '')
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                'SELECT path, name, size, mtime_ns FROM pdf_files '
+                'WHERE dir = ? OR (dir >= ? AND dir < ?) ORDER BY path',
+                (directory, prefix, prefix + '\uffff')
+            ).fetchall()
+        entries = [FileEntry(*row) for row in rows]
+        if extension:
+            extension = extension.lower()
+            entries = [e for e in entries if e.name.lower().endswith(extension)]
+        return entries
@@ -1,11 +1,41 @@
 import os
 import pandas as pd
-import json
+import numpy as np
+import io
+import hashlib
+import logging
 from pypdf import PdfWriter
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from directory_scanner import FileInventory
+from pdf_index import PdfIndex
+from merge_ledger import MergeLedger
+from pdf_source_cache import SourcePdfCache
+from run_metrics import StageMetrics
+from cancellation import Cancelled
 
-def start_merging_routine(dir, log_callback=None, progress_callback=None):
-    """Starts the PDF merging process with error handling."""
+logger = logging.getLogger(__name__)
+
+# Page entries the fast merge path leaves out of the output. pypdf copies every page
+# without them and then re-creates its annotations (remapping link targets) and
+# article beads unless they are excluded here; annotations are dropped with them
+FAST_MERGE_EXCLUDED_FIELDS = ('/Annots', '/B')
+
+def start_merging_routine(dir, log_callback=None, progress_callback=None, inventory=None, workers=4, metrics=None,
+                          cancel=None):
+    """Starts the PDF merging process with error handling.
+
+    :param inventory: FileInventory built earlier in the same pipeline run; when
+                      omitted the document folders are walked once here.
+    :param workers: Number of merges run concurrently.
+    :param metrics: StageMetrics receiving the merge counts, cache hits and the
+                    time of each merge; the pipeline saves it with the run record.
+    :param cancel: Optional CancelToken; merges finished before it is cancelled stay
+                   in the ledger and are skipped by the next run.
+    """
+    if metrics is None:
+        metrics = StageMetrics()
+    ledger = None
     try:
         excel_file = dir.xl_combi
         folder_path_gestor = dir.gestor_data
@@ -19,21 +49,24 @@ def start_merging_routine(dir, log_callback=None, progress_callback=None):
         suffix_column2 = 'Valor'
         nNF_column = 'nNF'
         merged_files_json = dir.merged_files_json
+        ledger = MergeLedger(dir.merged_files_db, legacy_json=merged_files_json)
         
         os.makedirs(output_folder, exist_ok=True)
-    
-        total_files = len([f for f in os.listdir(folder_path_gestor) if f.endswith(".pdf")]) + \
-                      len([f for f in os.listdir(folder_path_chNTR) if f.endswith(".pdf")])
-        if progress_callback:
-            progress_callback(0, total_files)
-        
+
+        if inventory is None:
+            inventory = FileInventory([folder_path_gestor, folder_path_chNTR], dir.scan_state).build()
+        pdf_index = PdfIndex(dir.pdf_index_db)
+        with metrics.timed('pdf_index'):
+            pdf_index.refresh(inventory)
+
         missing_files = set()
         successfully_merged_count = find_and_merge_pdfs(
             excel_file, folder_path_gestor, folder_path_chNTR, column1, column2, output_folder, 
             year_column, folder_column, suffix_column1, suffix_column2, nNF_column, 
             abbrev_length=3, log_callback=log_callback, 
-            progress_callback=progress_callback, total_files=total_files,
-            missing_files_set=missing_files, merged_files_json=merged_files_json
+            progress_callback=progress_callback,
+            missing_files_set=missing_files, ledger=ledger,
+            inventory=pdf_index, workers=workers, fast_merge=True, metrics=metrics, cancel=cancel
         )
         if log_callback:
             log_callback(f"Total de arquivos PDF ausentes: {len(missing_files)}")
@@ -41,166 +74,283 @@ def start_merging_routine(dir, log_callback=None, progress_callback=None):
         # Log today's date and time with the successfully merged files
         current_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         log_callback(f"Data de hoje: {current_date}. Total de arquivos mesclados: {successfully_merged_count}")
-        
-        # Save timestamp and merge count to CSV
-        save_execution_log(dir.execution_log_csv, successfully_merged_count, current_date)
 
+    except Cancelled:
+        raise
     except Exception as e:
+        metrics.count('errors')
         if log_callback:
             log_callback(f"Erro ao iniciar o processo de mesclagem: {e}")
+    finally:
+        if ledger is not None:
+            ledger.close()
+
+def build_pdf_maps(inventory, folder_path_gestor, folder_path_chNTR, ignore_folders=('Auditoria',)):
+    """Maps PDF names to paths for the gestor, chNTR and complementary (CCe) files.
+
+    Gestor PDFs inside ignored folders are skipped and those in a "CCe" folder are
+    complementary; chNTR PDFs are keyed without their "-nfe" suffix.
+
+    :param inventory: FileInventory or PdfIndex listing the files of both folders.
+    """
+    pdf_files_gestor = {}
+    pdf_files_chNTR = {}
+    complementary_files = {}
+
+    for entry in inventory.files(folder_path_gestor):
+        if entry.name.endswith(".pdf"):
+            root = os.path.dirname(entry.path)
+            relative_dirs = os.path.relpath(root, os.path.abspath(folder_path_gestor)).split(os.sep)
+            if any(d in ignore_folders for d in relative_dirs):
+                continue
+            file_name = os.path.splitext(entry.name)[0]
+
+            if "CCe" in os.path.basename(root):
+                complementary_files[file_name] = entry.path
+            else:
+                pdf_files_gestor[file_name] = entry.path
+
+    for entry in inventory.files(folder_path_chNTR):
+        if entry.name.endswith(".pdf"):
+            file_name = os.path.splitext(entry.name)[0]
+            # Remove "-nfe" suffix if present
+            if file_name.endswith("-nfe"):
+                file_name = file_name[:-4]
+            pdf_files_chNTR[file_name] = entry.path
+
+    return pdf_files_gestor, pdf_files_chNTR, complementary_files
+
+def plan_merges(df, pdf_maps, column1, column2, output_folder, year_column, folder_column, suffix_column1, suffix_column2, nNF_column, abbrev_length=5, already_merged=()):
+    """Builds the merge plan for every row of the combined table with column operations.
+
+    :param pdf_maps: (pdf_files_gestor, pdf_files_chNTR, complementary_files) from build_pdf_maps.
+    :param already_merged: Output file names merged in previous runs, which are skipped.
+    :return: (plan, missing, invalid). plan has one row per merge to run, with
+             output_filename, output_path and the file1/file2/complementary source
+             paths; missing holds rows without any source PDF and invalid rows whose
+             value or nNF cannot be formatted.
+    """
+    pdf_files_gestor, pdf_files_chNTR, complementary_files = pdf_maps
+
+    if 'index' in df.columns:
+        df = df[df['index'] != 2]
+
+    # map(str) formats each value as str() did in the row loop, blanks as 'nan';
+    # with pandas' string dtype (the default from pandas 3) astype(str) keeps them NaN
+    file1 = df[column1].map(str)
+    file2 = df[column2].map(str)
+
+    suffix1 = df[suffix_column1].map(str).str[:abbrev_length].str.upper()
+
+    value = pd.to_numeric(df[suffix_column2], errors='coerce')
+    suffix2 = pd.Series(np.char.mod('%.2f', value.to_numpy(dtype=float)), index=df.index).str.replace('.', '-', regex=False)
+
+    raw_nNF = df[nNF_column] if nNF_column in df.columns else pd.Series(np.nan, index=df.index)
+    nNF_number = pd.to_numeric(raw_nNF, errors='coerce')
+    nNF_blank = raw_nNF.isna() | (raw_nNF.astype(str) == '')
+    nNF_text = np.trunc(nNF_number).astype('Int64').astype(str).where(~nNF_blank, 'sem-numero')
+
+    invalid = (value.isna() & df[suffix_column2].notna()) | (nNF_number.isna() & ~nNF_blank)
+
+    # Years are stored as integers, but a column with blanks is read back as floats (2024.0)
+    year_number = pd.to_numeric(df[year_column], errors='coerce')
+    year_text = np.trunc(year_number).astype('Int64').astype(str).where(year_number.notna(), df[year_column].map(str))
+
+    plan = pd.DataFrame({
+        'file1': file1,
+        'file2': file2,
+        'output_filename': suffix1 + '_' + nNF_text + '_' + file1.str[-8:] + '_' + file2.str[-8:] + '_' + suffix2 + '.pdf',
+        'output_path': os.path.join(output_folder, '') + year_text + os.sep + df[folder_column].map(str) + os.sep,
+        'file1_path': file1.map(pdf_files_gestor),
+        'file2_path': file2.map(pdf_files_chNTR),  # This now matches without "-nfe" suffix
+        'complementary_path': file1.map(complementary_files),
+    }, index=df.index)
+    plan['output_path'] = plan['output_path'] + plan['output_filename']
+    plan.index.name = 'index'
+
+    invalid_rows = plan[invalid]
+    plan = plan[~invalid & ~plan['output_filename'].isin(already_merged)]
 
-def find_and_merge_pdfs(excel_file, folder_path_gestor, folder_path_chNTR, column1, column2, output_folder, year_column, folder_column, suffix_column1, suffix_column2, nNF_column, abbrev_length=5, log_callback=None, progress_callback=None, total_files=0, missing_files_set=None, merged_files_json=None):
-    """Finds, merges, and names PDF files based on Excel data."""
-    
+    has_source = plan[['file1_path', 'file2_path', 'complementary_path']].notna().any(axis=1)
+    missing = plan[~has_source]
+    plan = plan[has_source]
+    # Rows resolving to the same output are merged only once
+    plan = plan[~plan['output_filename'].duplicated()]
+    return plan.reset_index(), missing, invalid_rows
+
+def find_and_merge_pdfs(excel_file, folder_path_gestor, folder_path_chNTR, column1, column2, output_folder, year_column, folder_column, suffix_column1, suffix_column2, nNF_column, abbrev_length=5, log_callback=None, progress_callback=None, missing_files_set=None, merged_files_json=None, inventory=None, workers=1, ledger=None, fast_merge=False, cache_size_mb=256, metrics=None, cancel=None):
+    """Finds, merges, and names PDF files based on Excel data.
+
+    Every merge is planned first and then executed, serially or by a pool of
+    `workers` threads; a failed merge is logged without stopping the others.
+    Finished merges are committed to the MergeLedger one by one; when no ledger
+    is given, one is opened next to merged_files_json, seeded from it and closed
+    before returning.
+    fast_merge selects the fast path of merge_pdfs. Source PDFs are read through a
+    SourcePdfCache of up to cache_size_mb, shared by every merge of the run.
+    Counts, cache hits and merge times go to the optional StageMetrics. When the
+    optional CancelToken is cancelled, Cancelled is raised once the merges already
+    running are finished and committed.
+    """
+    if metrics is None:
+        metrics = StageMetrics()
+    owns_ledger = ledger is None
     try:
-        # Load already merged files from JSON if it exists
-        if merged_files_json and os.path.exists(merged_files_json):
-            with open(merged_files_json, 'r') as json_file:
-                merged_files = json.load(json_file)
-        else:
-            merged_files = []
+        if owns_ledger:
+            ledger = MergeLedger(os.path.splitext(merged_files_json)[0] + '.db', legacy_json=merged_files_json)
 
         df = pd.read_excel(excel_file)
-        pdf_files_gestor = {}
-        pdf_files_chNTR = {}
-        complementary_files = {}
-
-        ignore_folders = ['Auditoria']
-
-        # Walk through gestor files
-        for root, dirs, files in os.walk(folder_path_gestor):
-            dirs[:] = [d for d in dirs if d not in ignore_folders]
-            for file in files:
-                if file.endswith(".pdf"):
-                    file_name = os.path.splitext(file)[0]
-                    file_path = os.path.join(root, file)
-                    
-                    if "CCe" in os.path.basename(root):
-                        complementary_files[file_name] = file_path
-                    else:
-                        pdf_files_gestor[file_name] = file_path
-
-        # Walk through chNTR files
-        for root, dirs, files in os.walk(folder_path_chNTR):
-            for file in files:
-                if file.endswith(".pdf"):
-                    file_name = os.path.splitext(file)[0]
-                    # Remove "-nfe" suffix if present
-                    if file_name.endswith("-nfe"):
-                        file_name = file_name[:-4]
-                    file_path = os.path.join(root, file)
-                    pdf_files_chNTR[file_name] = file_path
-
-        processed_files = 0
-        successfully_merged_count = 0
-        total_rows = len(df)
 
-        for index, row in df.iterrows():
-            try:
-                if row.get('index') == 2:
-                    continue
-                
-                file1 = str(row[column1])
-                file2 = str(row[column2])
-                file1_last8 = file1[-8:] if len(file1) >= 8 else file1
-                file2_last8 = file2[-8:] if len(file2) >= 8 else file2
-                
-                year = str(row[year_column])
-                subfolder_name = str(row[folder_column])
-
-                suffix1 = str(row[suffix_column1])[:abbrev_length].upper()
-                value = row[suffix_column2]
-                suffix2 = f"{value:.2f}".replace('.', '-')
-
-                nNF_value = row.get(nNF_column)
-                nNF_value = 'sem-numero' if pd.isna(nNF_value) or nNF_value == '' else int(nNF_value)
-
-                output_filename = f"{suffix1}_{nNF_value}_{file1_last8}_{file2_last8}_{suffix2}.pdf"
-                
-                if output_filename in merged_files:
-                    print(f"Pulando {output_filename} já mesclado.")
-                    continue
-                
-                file1_path = pdf_files_gestor.get(file1)
-                file2_path = pdf_files_chNTR.get(file2)  # This now matches without "-nfe" suffix
-
-                file1_complementary = complementary_files.get(file1)
-                
-                pdf_list = []
-                if file1_path:
-                    pdf_list.append(file1_path)
-                if file2_path:
-                    pdf_list.append(file2_path)
-                
-                if file1_complementary:
-                    pdf_list.append(file1_complementary)
-
-                if pdf_list:
-                    year_path = os.path.join(output_folder, year)
-                    os.makedirs(year_path, exist_ok=True)
-
-                    subfolder_path = os.path.join(year_path, subfolder_name)
-                    os.makedirs(subfolder_path, exist_ok=True)
-
-                    output_path = os.path.join(subfolder_path, output_filename)
-                    merge_pdfs(pdf_list, output_path)
-                    
-                    merged_files.append(output_filename)
-                    successfully_merged_count += 1
-                    print(f"Mesclando {file1} e {file2} {'com arquivos complementares' if len(pdf_list) > 2 else ''}")
-                    
-                    processed_files += len(pdf_list)
-
-                    if progress_callback:
-                        progress_callback(index + 1, total_rows)
-                else:
-                    missing_files = []
-                    if not file1_path:
-                        missing_files.append(file1)
-                    if not file2_path:
-                        missing_files.append(file2)
-                    
-                    if missing_files_set is not None:
-                        missing_files_set.update(missing_files)
-
-                    if log_callback:
-                        log_callback(f"Arquivos ausentes: {', '.join(missing_files)}")
+        # inventory may be a FileInventory or a PdfIndex; both list files per folder
+        if inventory is None:
+            inventory = FileInventory([folder_path_gestor, folder_path_chNTR]).build()
+        pdf_maps = build_pdf_maps(inventory, folder_path_gestor, folder_path_chNTR)
 
-            except Exception as e:
+        merge_plan, missing, invalid = plan_merges(
+            df, pdf_maps, column1, column2, output_folder, year_column, folder_column,
+            suffix_column1, suffix_column2, nNF_column, abbrev_length, ledger.merged
+        )
+        if log_callback:
+            log_callback(f"{len(merge_plan)} arquivos a mesclar, {len(missing)} linhas sem PDFs.")
+        metrics.count('planned', len(merge_plan))
+        metrics.count('missing', len(missing))
+        metrics.count('invalid', len(invalid))
+        if progress_callback:
+            progress_callback(0, len(merge_plan))
+
+        for index in invalid.index:
+            if log_callback:
+                log_callback(f"Erro ao mesclar arquivos para a linha {index}: valor ou nNF inválido")
+
+        for row in missing.itertuples():
+            missing_files = [row.file1, row.file2]
+            if missing_files_set is not None:
+                missing_files_set.update(missing_files)
+
+            if log_callback:
+                log_callback(f"Arquivos ausentes: {', '.join(missing_files)}")
+
+        source_cache = SourcePdfCache(cache_size_mb * 1024 * 1024)
+        successfully_merged_count = 0
+        merges = execute_merge_plan(merge_plan, workers, fast_merge, source_cache, metrics, cancel)
+        # Callbacks and the ledger are only touched from this thread, as merges complete
+        for merge, fingerprint, error in merges:
+            if error is None:
+                ledger.record(merge.output_filename, merge.output_path, (merge.file1, merge.file2), fingerprint)
+                successfully_merged_count += 1
+                logger.debug(f"Mesclando {merge.file1} e {merge.file2} {'com arquivos complementares' if len(merge_sources(merge)) > 2 else ''}")
+
+                if progress_callback:
+                    progress_callback(successfully_merged_count, len(merge_plan))
+            else:
+                metrics.count('errors')
                 if log_callback:
-                    log_callback(f"Erro ao mesclar arquivos para a linha {index}: {e}")
+                    log_callback(f"Erro ao mesclar arquivos para a linha {merge.index}: {error}")
 
-        # Save the updated list of merged files to JSON
-        with open(merged_files_json, 'w') as json_file:
-            json.dump(merged_files, json_file)
+        metrics.count('merged', successfully_merged_count)
+        metrics.count('pdf_cache_hits', source_cache.hits)
+        metrics.count('pdf_cache_misses', source_cache.misses)
+        metrics.count('pdf_cache_evictions', source_cache.evictions)
+        metrics.count('bytes_read', source_cache.bytes_read)
 
         if log_callback:
+            log_callback(source_cache.summary())
             log_callback(f"Mesclagem concluída. Total de arquivos mesclados nesta execução: {successfully_merged_count}")
         
         return successfully_merged_count
 
+    except Cancelled:
+        if log_callback:
+            log_callback("Mesclagem cancelada; os arquivos já mesclados foram registrados.")
+        raise
     except Exception as e:
+        metrics.count('errors')
         if log_callback:
             log_callback(f"Erro ao buscar e mesclar PDFs: {e}")
         return 0
+    finally:
+        if owns_ledger and ledger is not None:
+            ledger.close()
+
+def merge_sources(merge):
+    """Returns the source PDFs of a planned merge, in merge order."""
+    return [path for path in (merge.file1_path, merge.file2_path, merge.complementary_path) if isinstance(path, str)]
+
+def _run_merge(merge, fast, cache, metrics):
+    """Creates the output folder and merges one planned entry, returning its fingerprint."""
+    with metrics.timed('merge'):
+        os.makedirs(os.path.dirname(merge.output_path), exist_ok=True)
+        return merge_pdfs(merge_sources(merge), merge.output_path, fast=fast, cache=cache, metrics=metrics)
+
+def execute_merge_plan(merge_plan, workers=1, fast=False, cache=None, metrics=None, cancel=None):
+    """Runs the planned merges and yields (merge, fingerprint, error) as each one finishes.
+
+    merge_plan is the table returned by plan_merges; each merge is one of its rows
+    as a namedtuple. With workers > 1 the merges run in a thread pool, since they
+    are bound by reads and writes on the shared drives; error is None on success.
+    The optional CancelToken is checked before each merge; with workers > 1 the
+    queued merges are dropped and the running ones are yielded before Cancelled
+    is raised.
+    """
+    if metrics is None:
+        metrics = StageMetrics()
+    merges = list(merge_plan.itertuples(index=False))
+    if workers <= 1:
+        for merge in merges:
+            if cancel is not None:
+                cancel.check()
+            try:
+                fingerprint, error = _run_merge(merge, fast, cache, metrics), None
+            except Exception as e:
+                fingerprint, error = None, e
+            yield merge, fingerprint, error
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(_run_merge, merge, fast, cache, metrics): merge for merge in merges}
+        for future in as_completed(futures):
+            if cancel is not None and cancel.cancelled:
+                # Drop the queued merges; the running ones still complete and are yielded
+                for queued in futures:
+                    queued.cancel()
+            if future.cancelled():
+                continue
+            error = future.exception()
+            yield futures[future], None if error else future.result(), error
+    if cancel is not None:
+        cancel.check()
 
-def merge_pdfs(pdf_list, output_path):
-    """Merges PDF files from pdf_list into a single PDF at output_path."""
+def merge_pdfs(pdf_list, output_path, fast=False, cache=None, metrics=None):
+    """Merges PDF files from pdf_list into a single PDF at output_path.
+
+    The output is assembled in memory and written with a single call; the
+    blake2b hash of the written bytes is returned as its fingerprint.
+
+    :param fast: Leave the outlines, annotations and article beads of the sources
+                 out of the output, which DANFE/CT-e merges do not need; pypdf then
+                 skips copying the outline and re-creating the annotations of each
+                 page. Sources are read the same way either way: pypdf loads a
+                 path fully into memory before parsing it.
+    :param cache: Optional SourcePdfCache to reuse sources that appear in several merges.
+    :param metrics: Optional StageMetrics counting the bytes written.
+    """
+    options = {'import_outline': False, 'excluded_fields': FAST_MERGE_EXCLUDED_FIELDS} if fast else {}
     try:
         merger = PdfWriter()
         for pdf in pdf_list:
-            merger.append(pdf)
-        merger.write(output_path)
+            if cache is not None:
+                with cache.reader(pdf) as reader:
+                    merger.append(reader, **options)
+            else:
+                merger.append(pdf, **options)
+        buffer = io.BytesIO()
+        merger.write(buffer)
         merger.close()
+        data = buffer.getvalue()
+        with open(output_path, 'wb') as output_file:
+            output_file.write(data)
+        if metrics is not None:
+            metrics.count('bytes_written', len(data))
+        return hashlib.blake2b(data, digest_size=16).hexdigest()
     except Exception as e:
         raise RuntimeError(f"Erro ao mesclar PDFs: {e}")
-
-def save_execution_log(csv_file, merged_count, timestamp):
-    """Saves the execution timestamp and number of merged files to a CSV."""
-    data = {'Timestamp': [timestamp], 'Files Merged': [merged_count]}
-    df = pd.DataFrame(data)
-    
-    if not os.path.exists(csv_file):
-        df.to_csv(csv_file, index=False)
-    else:
-        df.to_csv(csv_file, mode='a', header=False, index=False)
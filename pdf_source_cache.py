@@ -0,0 +1,77 @@
+import io
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pypdf import PdfReader
+
+class _CachedPdf:
+    __slots__ = ('lock', 'reader', 'size')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reader = None
+        self.size = 0
+
+class SourcePdfCache:
+    """LRU cache of parsed source PDFs shared by the merges of one run, bounded by file size.
+
+    One CT-e is often the source of many merged invoices; the cache reads and
+    parses it from the share once. Each entry has its own lock: a thread that
+    asks for a PDF another thread is loading waits for it instead of reading it
+    again, and a reader is used by one merge at a time since pypdf readers keep
+    a single stream position.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes_read = 0
+
+    @contextmanager
+    def reader(self, pdf_path):
+        """Yield the PdfReader for pdf_path, loading it with one bulk read on a miss."""
+        with self._lock:
+            entry = self._entries.get(pdf_path)
+            if entry is None:
+                entry = self._entries[pdf_path] = _CachedPdf()
+                self.misses += 1
+            else:
+                self._entries.move_to_end(pdf_path)
+                self.hits += 1
+
+        with entry.lock:
+            if entry.reader is None:
+                try:
+                    with open(pdf_path, 'rb') as pdf_file:
+                        data = pdf_file.read()
+                    entry.reader = PdfReader(io.BytesIO(data))
+                except Exception:
+                    with self._lock:
+                        if self._entries.get(pdf_path) is entry:
+                            del self._entries[pdf_path]
+                    raise
+                with self._lock:
+                    self.bytes_read += len(data)
+                    if self._entries.get(pdf_path) is entry:
+                        entry.size = len(data)
+                        self.size += entry.size
+                        self._evict()
+            yield entry.reader
+
+    def _evict(self):
+        while self.size > self.max_bytes and self._entries:
+            _, entry = self._entries.popitem(last=False)
+            self.size -= entry.size
+            self.evictions += 1
+
+    def summary(self):
+        """Return a one-line report of the cache hits and misses."""
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups * 100 if lookups else 0
+        return (f"Cache de PDFs: {self.hits} acertos, {self.misses} leituras ({hit_rate:.0f}% de acertos), "
+                f"{self.evictions} descartados, {self.size / 1024 / 1024:.1f} MB em cache")
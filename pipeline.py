@@ -0,0 +1,387 @@
+import os
+import time
+import queue
+import asyncio
+import threading
+import importlib
+from collections import namedtuple
+from xml_cache_controller import XMLreading
+from directory_scanner import FileInventory, SharedWalk
+from run_metrics import RunMetrics
+from cancellation import CancelToken, Cancelled
+
+# Modules that pull in pandas, openpyxl and pypdf. Stages import them when they
+# first run, so the GUI window opens without waiting for them; warm_up() loads
+# them ahead of time in the background.
+HEAVY_MODULES = ('pandas', 'openpyxl', 'xml_handler', 'record_store', 'xlsx_export', 'pdf_merge_routines')
+
+def warm_up():
+    """Import the HEAVY_MODULES and return the seconds it took; safe to run in a background thread."""
+    start = time.perf_counter()
+    for module in HEAVY_MODULES:
+        importlib.import_module(module)
+    return time.perf_counter() - start
+
+PipelineEvent = namedtuple('PipelineEvent', ['kind', 'stage', 'data'])
+"""Event sent to the pipeline subscribers.
+
+kind is one of 'log' (data: message), 'progress' (data: (value, maximum)),
+'stage_started', 'stage_finished', 'stage_skipped', 'stage_cancelled',
+'stage_failed' (data: the exception), 'run_metrics' (data: the run record saved by RunMetrics) and
+'pipeline_finished' (data: dict of stage -> status).
+"""
+
+class Handoff(queue.Queue):
+    """Bounded queue of file paths from a streaming scan to its extraction, closed with None."""
+
+    closed = False
+
+    def __init__(self, maxsize=0):
+        super().__init__(maxsize)
+        self._closing = False
+        self._closing_lock = threading.Lock()
+
+    def close(self):
+        """Put the closing None; later calls do nothing, so the scan and the pipeline may both call it."""
+        with self._closing_lock:
+            if self._closing:
+                return
+            self._closing = True
+        self.put(None)
+
+    def get(self, *args, **kwargs):
+        item = super().get(*args, **kwargs)
+        if item is None:
+            self.closed = True
+        return item
+
+    def discard(self):
+        """Drop the remaining paths, so the scan never blocks on an extraction that stopped early."""
+        while not self.closed:
+            self.get()
+
+def stream_scan(pipeline, stage, reader, csv_file):
+    """Puts each new file found by the reader on the stage's handoff queue, closing it with None.
+
+    The CSV is still written, as a checkpoint of the files handed over; the files
+    it lists from an interrupted run are handed over first. The files are read
+    from the run's shared walk while it goes on, or from the inventory given to
+    the pipeline.
+    """
+    file_queue = pipeline.handoffs[stage]
+    try:
+        metrics = pipeline.metrics.stage(stage)
+        source = pipeline.shared_walk or pipeline.inventory
+        for xml_file_path in reader.stream_new_files(csv_file, source, metrics, pipeline.cancel_token):
+            file_queue.put(xml_file_path)
+    finally:
+        file_queue.close()
+
+def scan_compras(pipeline):
+    """Lists the new or modified purchase XMLs in new_compras."""
+    path_to = pipeline.path_to
+    xmltocsv = XMLreading(path_to.xml_data, path_to.cache_compras, state_file=path_to.scan_state)
+    if 'scan_compras' in pipeline.handoffs:
+        stream_scan(pipeline, 'scan_compras', xmltocsv, path_to.new_compras)
+    else:
+        xmltocsv.process_new_files(
+            path_to.new_compras, pipeline.get_inventory(), pipeline.metrics.stage('scan_compras'), pipeline.cancel_token
+        )
+    pipeline.log("XML scanning completed successfully.")
+
+def scan_gestor(pipeline):
+    """Lists the new or modified Gestor XMLs in new_gestor."""
+    path_to = pipeline.path_to
+    gestor_processor = XMLreading(path_to.gestor_data, path_to.cache_gestor, state_file=path_to.scan_state)
+    if 'scan_gestor' in pipeline.handoffs:
+        stream_scan(pipeline, 'scan_gestor', gestor_processor, path_to.new_gestor)
+        return
+    metrics = pipeline.metrics.stage('scan_gestor')
+    try:
+        gestor_processor.process_new_files(path_to.new_gestor, pipeline.get_inventory(), metrics, pipeline.cancel_token)
+    except Cancelled:
+        raise
+    except Exception as e:
+        pipeline.log(f"Erro escaneando arquivos do gestor: {e}")
+        metrics.count('errors')
+        gestor_processor.process_new_files(path_to.new_gestor, metrics=metrics, cancel=pipeline.cancel_token)
+
+def extract_records(pipeline, extraction_type, excel_file_path, new_files_csv, scan_stage):
+    """Extracts the listed XMLs that are not in the record store yet and stores them.
+
+    When the scan stage streams its files, they are extracted from its handoff
+    queue while it runs instead of from the new files CSV. Records are stored
+    chunk by chunk and the CSV is removed only once every file in it is stored,
+    so a cancelled or failed extraction resumes from the same list.
+    """
+    from xml_handler import XMLProcessor, ProcessedIndex
+    from record_store import RecordStore
+
+    processor = XMLProcessor()
+    metrics = pipeline.metrics.stage(extraction_type)
+    store = RecordStore(pipeline.path_to.records_db)
+    store.import_excel(extraction_type, excel_file_path)
+
+    existing_data = ProcessedIndex.from_store(store, extraction_type)
+    if scan_stage in pipeline.handoffs:
+        inserted = processor.stream_to_store(
+            pipeline.handoffs[scan_stage], existing_data, store, extraction_type=extraction_type,
+            workers=pipeline.workers, metrics=metrics, cancel=pipeline.cancel_token
+        )
+    else:
+        new_files = processor.load_new_files_list(new_files_csv)
+        inserted = processor.extract_to_store(
+            new_files, existing_data, store, extraction_type=extraction_type, workers=pipeline.workers,
+            metrics=metrics, cancel=pipeline.cancel_token
+        )
+    # A cancelled streaming scan may have listed files it never handed over
+    if not pipeline.cancel_token.cancelled:
+        processor.clear_new_files_list(new_files_csv)
+    metrics.count('skipped', existing_data.skipped)
+    metrics.count('records_saved', inserted)
+    pipeline.log(existing_data.summary())
+
+def extract_gestor(pipeline):
+    """Runs the XML processing for Gestor."""
+    extract_records(pipeline, 'gestor', pipeline.path_to.xl_gestor, pipeline.path_to.new_gestor, 'scan_gestor')
+    pipeline.log("XML Gestor processing completed successfully.")
+
+def extract_compras(pipeline):
+    """Runs the XML processing for Compras."""
+    extract_records(pipeline, 'compras', pipeline.path_to.xl_compras, pipeline.path_to.new_compras, 'scan_compras')
+    pipeline.log("XML Compras processing completed successfully.")
+
+def combine_excel(pipeline):
+    """Joins the Compras and Gestor records into xl_combi and the xl_consulta table."""
+    from xml_handler import ExcelMerger
+    from record_store import RecordStore
+
+    path_to = pipeline.path_to
+    file1 = path_to.xl_compras
+    file2 = path_to.xl_gestor
+    column_to_merge_on = 'chNTR'
+
+    store = RecordStore(path_to.records_db)
+    store.import_excel('compras', file1)
+    store.import_excel('gestor', file2)
+
+    merger = ExcelMerger(file1, file2, column_to_merge_on, [path_to.xl_combi, path_to.xl_consulta], store=store)
+    merger.merge_excel_files(
+        tables=[path_to.xl_consulta], metrics=pipeline.metrics.stage('excel'), cancel=pipeline.cancel_token
+    )
+    pipeline.log("Excel merging completed successfully.")
+
+def merge_pdfs(pipeline):
+    """Runs the PDF merging process."""
+    from pdf_merge_routines import start_merging_routine
+
+    start_merging_routine(
+        dir=pipeline.path_to,
+        log_callback=pipeline.log,
+        progress_callback=pipeline.progress,
+        inventory=pipeline.get_inventory(),
+        workers=pipeline.merge_workers,
+        metrics=pipeline.metrics.stage('merge'),
+        cancel=pipeline.cancel_token
+    )
+
+class Pipeline:
+    """Runs the scan, extraction, Excel and PDF merge stages as a dependency graph.
+
+    Each stage starts as soon as the stages it depends on have finished, so the
+    Gestor and Compras branches run side by side. Stages run in worker threads of
+    an asyncio event loop; progress is reported to subscribers as PipelineEvent
+    objects, from whichever thread produced it, so a GUI should hand them over
+    to its own thread (e.g. through a queue.Queue) before touching widgets.
+
+    In streaming mode a scan and its extraction run together: the scan puts each
+    new file on a bounded handoff queue as it walks the folders, and the
+    extraction parses and stores them while the walk goes on. The folders are
+    walked once per run by a SharedWalk that feeds both scans and then becomes
+    the run's inventory.
+
+    Every run collects a RunMetrics record (wall time, counters and latencies per
+    stage), appends it to the path_to.run_metrics JSON lines file and sends it to
+    the subscribers as a 'run_metrics' event.
+
+    cancel() asks the running stages to stop at their next checkpoint; they save
+    what they finished (scan cache, stored records, merge ledger) first, so the
+    next run resumes where this one stopped. The stages that have not started
+    are cancelled too. A cancelled Pipeline stays cancelled; use a new one.
+    """
+
+    # stage -> (function, stages it depends on)
+    STAGES = {
+        'scan_compras': (scan_compras, ()),
+        'scan_gestor': (scan_gestor, ()),
+        'gestor': (extract_gestor, ('scan_gestor',)),
+        'compras': (extract_compras, ('scan_compras',)),
+        'excel': (combine_excel, ('gestor', 'compras')),
+        'merge': (merge_pdfs, ('excel',)),
+    }
+
+    # extraction stage -> scan stage that can stream files to it
+    STREAMS = {'gestor': 'scan_gestor', 'compras': 'scan_compras'}
+
+    # scan stage -> DIR attribute of the folder it scans
+    SCAN_FOLDERS = {'scan_compras': 'xml_data', 'scan_gestor': 'gestor_data'}
+
+    def __init__(self, path_to, workers=None, merge_workers=4, inventory=None, streaming=False, queue_size=1024):
+        """
+        :param path_to: DIR configuration with the folders and files of the run.
+        :param workers: Processes used by each XML extraction (default: os.cpu_count()).
+        :param merge_workers: Merges run concurrently by the PDF merge stage.
+        :param inventory: FileInventory to reuse; built on first use otherwise.
+        :param streaming: Stream files from each scan to its extraction when both run.
+        :param queue_size: Files a streaming scan may get ahead of its extraction.
+        """
+        self.path_to = path_to
+        self.workers = workers or os.cpu_count()
+        self.merge_workers = merge_workers
+        self.inventory = inventory
+        self.streaming = streaming
+        self.queue_size = queue_size
+        self.handoffs = {}
+        self.shared_walk = None
+        self.metrics = RunMetrics()
+        self.cancel_token = CancelToken()
+        self._inventory_lock = threading.Lock()
+        self._subscribers = []
+        self._subscribers_lock = threading.Lock()
+
+    @classmethod
+    def downstream(cls, stages):
+        """Return the given stages plus every stage that depends on them, in graph order."""
+        selected = set(stages)
+        for stage, (_, dependencies) in cls.STAGES.items():
+            if selected.intersection(dependencies):
+                selected.add(stage)
+        return [stage for stage in cls.STAGES if stage in selected]
+
+    def subscribe(self, callback):
+        """Call callback(event) for every PipelineEvent; it may run on any thread."""
+        with self._subscribers_lock:
+            self._subscribers.append(callback)
+
+    def emit(self, kind, stage=None, data=None):
+        event = PipelineEvent(kind, stage, data)
+        with self._subscribers_lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            callback(event)
+
+    def log(self, message):
+        self.emit('log', data=message)
+
+    def progress(self, value, maximum):
+        self.emit('progress', data=(value, maximum))
+
+    def cancel(self):
+        """Ask the running stages to stop at their next checkpoint; safe to call from any thread."""
+        if not self.cancel_token.cancelled:
+            self.cancel_token.cancel()
+            self.log("Cancelamento solicitado; aguardando as etapas salvarem o progresso...")
+
+    def new_inventory(self):
+        path_to = self.path_to
+        return FileInventory([path_to.xml_data, path_to.gestor_data, path_to.chNTR_data], path_to.scan_state)
+
+    def get_inventory(self):
+        """Return the run's FileInventory, walking the document folders on first use.
+
+        In streaming mode the walk shared with the scans is awaited instead.
+        """
+        with self._inventory_lock:
+            if self.inventory is None:
+                metrics = self.metrics.stage('inventory')
+                if self.shared_walk is not None:
+                    self.inventory = self.shared_walk.wait()
+                    metrics.observe('build', self.shared_walk.seconds)
+                else:
+                    with metrics.timed('build'):
+                        self.inventory = self.new_inventory().build()
+                metrics.count('files', sum(len(entries) for entries in self.inventory.entries.values()))
+                metrics.count('listing_hits', self.inventory.stats['pruned'])
+                metrics.count('listing_misses', self.inventory.stats['listed'])
+                metrics.count('errors', self.inventory.stats['errors'])
+            return self.inventory
+
+    async def _run_stage(self, stage, tasks):
+        try:
+            return await self._execute_stage(stage, tasks)
+        finally:
+            # Whether or not the stages ran, a streaming scan must close its handoff and never
+            # block on it, and its extraction must not wait for files that will never come
+            loop = asyncio.get_running_loop()
+            if stage in self.handoffs:
+                await loop.run_in_executor(None, self.handoffs[stage].close)
+            handoff = self.handoffs.get(self.STREAMS.get(stage))
+            if handoff is not None:
+                await loop.run_in_executor(None, handoff.discard)
+
+    async def _execute_stage(self, stage, tasks):
+        function, dependencies = self.STAGES[stage]
+        # A streaming extraction runs alongside its scan rather than after it
+        dependencies = [dep for dep in dependencies if dep not in self.handoffs or self.STREAMS.get(stage) != dep]
+        statuses = [await tasks[dep] for dep in dependencies if dep in tasks]
+        if self.cancel_token.cancelled:
+            self.metrics.stage(stage).status = 'cancelled'
+            self.emit('stage_cancelled', stage)
+            return 'cancelled'
+        if any(status != 'finished' for status in statuses):
+            self.metrics.stage(stage).status = 'skipped'
+            self.emit('stage_skipped', stage)
+            return 'skipped'
+
+        self.emit('stage_started', stage)
+        loop = asyncio.get_running_loop()
+        try:
+            with self.metrics.measure(stage):
+                await loop.run_in_executor(None, function, self)
+        except Cancelled:
+            self.log(f"Etapa {stage} cancelada.")
+            self.emit('stage_cancelled', stage)
+            return 'cancelled'
+        except Exception as e:
+            self.log(f"Erro na etapa {stage}: {e}")
+            self.emit('stage_failed', stage, e)
+            return 'failed'
+        self.emit('stage_finished', stage)
+        return 'finished'
+
+    async def run_async(self, stages=None):
+        """Run the selected stages (all by default) and return a dict of stage -> status.
+
+        Dependencies left out of the selection are taken as already satisfied; a
+        stage whose selected dependency failed is skipped.
+        """
+        selected = [stage for stage in self.STAGES if stages is None or stage in stages]
+        self.metrics = RunMetrics()
+        self.handoffs = {
+            scan: Handoff(maxsize=self.queue_size) for stage, scan in self.STREAMS.items()
+            if self.streaming and stage in selected and scan in selected
+        }
+        self.shared_walk = None
+        if self.handoffs and self.inventory is None:
+            folders = [getattr(self.path_to, self.SCAN_FOLDERS[scan]) for scan in self.handoffs]
+            self.shared_walk = SharedWalk(self.new_inventory(), folders, self.cancel_token).start()
+        tasks = {}
+        for stage in selected:
+            tasks[stage] = asyncio.ensure_future(self._run_stage(stage, tasks))
+        results = dict(zip(tasks, await asyncio.gather(*tasks.values())))
+        if self.shared_walk is not None and self.inventory is None:
+            # Record the shared walk in the run metrics even when no stage asked for the inventory
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self.get_inventory)
+            except Exception:
+                pass
+        try:
+            self.emit('run_metrics', data=self.metrics.save(self.path_to.run_metrics))
+        except Exception as e:
+            self.log(f"Erro ao salvar as métricas da execução: {e}")
+        self.emit('pipeline_finished', data=results)
+        return results
+
+    def run(self, stages=None):
+        """Blocking version of run_async, for use from a worker thread or a script."""
+        return asyncio.run(self.run_async(stages))
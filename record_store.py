@@ -0,0 +1,198 @@
+import os
+import sqlite3
+import logging
+from contextlib import closing
+import pandas as pd
+from xlsx_export import write_excel
+
+logger = logging.getLogger(__name__)
+
+class RecordStore:
+    """SQLite system of record for extracted XML data; the .xlsx files are export views of it.
+
+    The combined table (compras joined with gestor, as written to xl_combi) is
+    kept in the store as well and updated incrementally by join().
+    """
+
+    # Column affinities let SQLite keep access keys as text while storing numbers as numbers
+    TABLES = {
+        'gestor': {
+            'key': 'chNTR',
+            'columns': {'chNTR': 'TEXT', 'nNF': 'INTEGER', 'dhEmi': 'INTEGER', 'xFant': 'TEXT'},
+        },
+        'compras': {
+            'key': 'file_name',
+            'columns': {'file_name': 'TEXT', 'chNF': 'TEXT', 'chNTR': 'TEXT', 'xMun': 'TEXT', 'vProd': 'REAL'},
+        },
+    }
+
+    # Combined column -> (affinity, source expression); one row per compras record
+    # whose chNF is a stored gestor key, g1 being the gestor row of its chNTR
+    COMBINED_COLUMNS = {
+        'Municipio': ('TEXT', 'c.xMun'),
+        'chNTR': ('TEXT', 'c.chNTR'),
+        'nNTR': ('INTEGER', 'g1.nNF'),
+        'chNF': ('TEXT', 'c.chNF'),
+        'nNF': ('INTEGER', 'g2.nNF'),
+        'Valor': ('REAL', 'c.vProd'),
+        'FOR': ('TEXT', 'g2.xFant'),
+        'Ano': ('INTEGER', 'g1.dhEmi'),
+    }
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            for table, spec in self.TABLES.items():
+                column_defs = ', '.join(f'"{col}" {affinity}' for col, affinity in spec['columns'].items())
+                conn.execute(f'CREATE TABLE IF NOT EXISTS {table} ({column_defs}, PRIMARY KEY ("{spec["key"]}"))')
+
+            # Lookups of the compras records affected by new gestor keys
+            conn.execute('CREATE INDEX IF NOT EXISTS compras_chNF ON compras ("chNF")')
+            conn.execute('CREATE INDEX IF NOT EXISTS compras_chNTR ON compras ("chNTR")')
+            column_defs = ', '.join(f'"{col}" {affinity}' for col, (affinity, _) in self.COMBINED_COLUMNS.items())
+            conn.execute(
+                f'CREATE TABLE IF NOT EXISTS combined (file_name TEXT PRIMARY KEY, compras_rowid INTEGER, {column_defs})'
+            )
+            # Highest compras and gestor rowids already reflected in the combined table
+            conn.execute('CREATE TABLE IF NOT EXISTS join_state (source TEXT PRIMARY KEY, last_rowid INTEGER)')
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def columns(self, extraction_type):
+        """Return the column names stored for the extraction type."""
+        return list(self.TABLES[extraction_type]['columns'])
+
+    def count(self, extraction_type):
+        """Return the number of records stored for the extraction type."""
+        with closing(self._connect()) as conn:
+            return conn.execute(f'SELECT COUNT(*) FROM {extraction_type}').fetchone()[0]
+
+    def keys(self, extraction_type):
+        """Return the set of keys (chNTR for gestor, file_name for compras) already stored."""
+        key = self.TABLES[extraction_type]['key']
+        with closing(self._connect()) as conn:
+            return {row[0] for row in conn.execute(f'SELECT "{key}" FROM {extraction_type}')}
+
+    def _write(self, extraction_type, xml_data, conflict_clause):
+        columns = self.columns(extraction_type)
+        rows = list(zip(*(xml_data[col] for col in columns)))
+        if not rows:
+            return 0
+        column_list = ', '.join(f'"{col}"' for col in columns)
+        placeholders = ', '.join('?' for _ in columns)
+        with closing(self._connect()) as conn, conn:
+            before = conn.total_changes
+            conn.executemany(
+                f'INSERT INTO {extraction_type} ({column_list}) VALUES ({placeholders}) {conflict_clause}', rows
+            )
+            return conn.total_changes - before
+
+    def append(self, extraction_type, xml_data):
+        """Insert new records, keeping the stored row when the key already exists.
+
+        :param xml_data: Dict of column lists, as built by XMLProcessor.build_xml_file_mapping.
+        :return: Number of records inserted.
+        """
+        key = self.TABLES[extraction_type]['key']
+        return self._write(extraction_type, xml_data, f'ON CONFLICT("{key}") DO NOTHING')
+
+    def upsert(self, extraction_type, xml_data):
+        """Insert new records and overwrite stored ones that share the same key.
+
+        Updated rows keep their rowid, so the next join() rebuilds the combined table.
+
+        :return: Number of records inserted or updated.
+        """
+        key = self.TABLES[extraction_type]['key']
+        updates = ', '.join(f'"{col}" = excluded."{col}"' for col in self.columns(extraction_type) if col != key)
+        written = self._write(extraction_type, xml_data, f'ON CONFLICT("{key}") DO UPDATE SET {updates}')
+        if written:
+            with closing(self._connect()) as conn, conn:
+                conn.execute('DELETE FROM join_state')
+        return written
+
+    def join(self, full=False):
+        """Bring the combined table up to date with the compras and gestor records.
+
+        Only compras records added since the last join, and those whose chNF or
+        chNTR matches a gestor record added since then, are joined again; the
+        keyed lookups use the gestor primary key and the compras indexes.
+
+        :param full: Rebuild the whole table instead.
+        :return: Number of combined rows inserted or updated.
+        """
+        columns = ', '.join(f'"{col}"' for col in self.COMBINED_COLUMNS)
+        expressions = ', '.join(expression for _, expression in self.COMBINED_COLUMNS.values())
+        updates = ', '.join(f'"{col}" = excluded."{col}"' for col in ['compras_rowid', *self.COMBINED_COLUMNS])
+        with closing(self._connect()) as conn:
+            # Keep writers out until the watermarks are saved with the rows they cover
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                marks = dict(conn.execute('SELECT source, last_rowid FROM join_state'))
+                if full or not marks:
+                    conn.execute('DELETE FROM combined')
+                    marks = {}
+                compras_mark, gestor_mark = marks.get('compras', 0), marks.get('gestor', 0)
+
+                before = conn.total_changes
+                conn.execute(
+                    f'INSERT INTO combined (file_name, compras_rowid, {columns}) '
+                    f'SELECT c.file_name, c.rowid, {expressions} '
+                    'FROM compras c '
+                    'JOIN gestor g2 ON g2.chNTR = c.chNF '
+                    'LEFT JOIN gestor g1 ON g1.chNTR = c.chNTR '
+                    'WHERE c.rowid > :compras '
+                    'OR c.chNF IN (SELECT chNTR FROM gestor WHERE rowid > :gestor) '
+                    'OR c.chNTR IN (SELECT chNTR FROM gestor WHERE rowid > :gestor) '
+                    f'ON CONFLICT(file_name) DO UPDATE SET {updates}',
+                    {'compras': compras_mark, 'gestor': gestor_mark}
+                )
+                joined = conn.total_changes - before
+
+                for table in ('compras', 'gestor'):
+                    conn.execute(
+                        f'INSERT OR REPLACE INTO join_state (source, last_rowid) SELECT ?, COALESCE(MAX(rowid), 0) FROM {table}',
+                        (table,)
+                    )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        return joined
+
+    def load_combined(self):
+        """Load the combined table as a DataFrame, ordered by chNTR and then compras insertion order."""
+        column_list = ', '.join(f'"{col}"' for col in self.COMBINED_COLUMNS)
+        with closing(self._connect()) as conn:
+            return pd.read_sql_query(
+                f'SELECT {column_list} FROM combined ORDER BY chNTR IS NULL, chNTR, compras_rowid', conn
+            )
+
+    def load(self, extraction_type):
+        """Load every record of the extraction type as a DataFrame, in insertion order."""
+        column_list = ', '.join(f'"{col}"' for col in self.columns(extraction_type))
+        with closing(self._connect()) as conn:
+            return pd.read_sql_query(f'SELECT {column_list} FROM {extraction_type} ORDER BY rowid', conn)
+
+    def import_excel(self, extraction_type, excel_file_path):
+        """Seed an empty table from the legacy .xlsx file, if there is one.
+
+        :return: Number of records imported.
+        """
+        if self.count(extraction_type) or not os.path.exists(excel_file_path):
+            return 0
+        columns = self.columns(extraction_type)
+        legacy = pd.read_excel(excel_file_path).reindex(columns=columns)
+        legacy = legacy.astype(object).where(legacy.notna(), None)
+        imported = self.append(extraction_type, {col: legacy[col].tolist() for col in columns})
+        logger.info(f"Imported {imported} records from {excel_file_path}")
+        return imported
+
+    def export_excel(self, extraction_type, excel_file_path):
+        """Write the stored records of the extraction type to an .xlsx view."""
+        write_excel(self.load(extraction_type), excel_file_path)
+        logger.info(f"Data saved to: {excel_file_path}")
@@ -0,0 +1,229 @@
+import os
+import json
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime
+from cancellation import Cancelled
+
+# Upper bounds, in milliseconds, of the latency histogram buckets; slower samples go to an overflow bucket
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+class LatencyHistogram:
+    """Count, total, maximum and bucketed distribution of durations."""
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.buckets[bisect_left(LATENCY_BUCKETS_MS, seconds * 1000)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, fraction):
+        """Return the upper bound in seconds of the bucket holding the given fraction of samples."""
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for bound, samples in zip(LATENCY_BUCKETS_MS, self.buckets):
+            seen += samples
+            if seen >= rank:
+                return min(bound / 1000, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'total': round(self.total, 6),
+            'max': round(self.max, 6),
+            'p50': self.percentile(0.5),
+            'p95': self.percentile(0.95),
+            # [upper bound in ms (None for the overflow bucket), samples]
+            'buckets': [[bound, samples] for bound, samples in zip((*LATENCY_BUCKETS_MS, None), self.buckets) if samples],
+        }
+
+class StageMetrics:
+    """Counters and latency histograms of one pipeline stage; safe to update from several threads.
+
+    Counter names ending in _hits and _misses are reported together as a hit rate,
+    and those starting with bytes as a size.
+    """
+
+    def __init__(self, name=None):
+        self.name = name
+        self.status = None
+        self.wall_time = None
+        self.counters = {}
+        self.latencies = {}
+        self._lock = threading.Lock()
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name, seconds):
+        """Add one duration, e.g. the parse time of a file, to the named latency histogram."""
+        with self._lock:
+            histogram = self.latencies.get(name)
+            if histogram is None:
+                histogram = self.latencies[name] = LatencyHistogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timed(self, name):
+        """Observe the duration of the with block, whether or not it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'status': self.status,
+                'wall_time': None if self.wall_time is None else round(self.wall_time, 6),
+                'counters': dict(self.counters),
+                'latency': {name: histogram.to_dict() for name, histogram in self.latencies.items()},
+            }
+
+class RunMetrics:
+    """Metrics of one pipeline run, saved as one JSON line per run."""
+
+    def __init__(self):
+        self.started = datetime.now()
+        self.run_id = self.started.strftime('%Y%m%d-%H%M%S')
+        self.stages = {}
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def stage(self, name):
+        """Return the StageMetrics of the named stage, creating it on first use."""
+        with self._lock:
+            metrics = self.stages.get(name)
+            if metrics is None:
+                metrics = self.stages[name] = StageMetrics(name)
+            return metrics
+
+    @contextmanager
+    def measure(self, name):
+        """Yield the stage's metrics and record the wall time and status of the with block."""
+        metrics = self.stage(name)
+        start = time.perf_counter()
+        try:
+            yield metrics
+            metrics.status = 'finished'
+        except Cancelled:
+            metrics.status = 'cancelled'
+            raise
+        except Exception:
+            metrics.status = 'failed'
+            raise
+        finally:
+            metrics.wall_time = time.perf_counter() - start
+
+    def to_dict(self):
+        with self._lock:
+            stages = dict(self.stages)
+        return {
+            'run_id': self.run_id,
+            'started': self.started.isoformat(timespec='seconds'),
+            'duration': round(time.perf_counter() - self._start, 6),
+            'stages': {name: metrics.to_dict() for name, metrics in stages.items()},
+        }
+
+    def save(self, jsonl_path):
+        """Append the run record to the JSON lines file and return it."""
+        record = self.to_dict()
+        os.makedirs(os.path.dirname(os.path.abspath(jsonl_path)), exist_ok=True)
+        with open(jsonl_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        return record
+
+def load_runs(jsonl_path, limit=None):
+    """Return the saved run records, oldest first; limit keeps only the most recent ones."""
+    runs = []
+    if os.path.exists(jsonl_path):
+        with open(jsonl_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    runs.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue  # Line cut short by an interrupted run
+    return runs[-limit:] if limit else runs
+
+def find_run(runs, run_id):
+    """Return the run with the given id (or id prefix), or None."""
+    return next((run for run in reversed(runs) if run['run_id'].startswith(run_id)), None)
+
+def _format_bytes(value):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if value < 1024 or unit == 'GB':
+            return f"{value:.0f} {unit}" if unit == 'B' else f"{value:.1f} {unit}"
+        value /= 1024
+
+def _format_seconds(value):
+    return f"{value * 1000:.0f} ms" if value < 1 else f"{value:.1f}s"
+
+def _format_counters(counters):
+    parts = []
+    for name, value in counters.items():
+        if name.endswith('_misses') and name[:-len('_misses')] + '_hits' in counters:
+            continue
+        if name.endswith('_hits'):
+            misses = counters.get(name[:-len('_hits')] + '_misses', 0)
+            lookups = value + misses
+            parts.append(f"{name[:-len('_hits')]} {value / lookups * 100 if lookups else 0:.0f}% acertos ({value}/{lookups})")
+        elif name.startswith('bytes'):
+            parts.append(f"{name} {_format_bytes(value)}")
+        else:
+            parts.append(f"{name} {value}")
+    return parts
+
+def format_run(record):
+    """Return the summary lines of a run record, one per stage."""
+    lines = [f"Execução {record['run_id']}: {_format_seconds(record['duration'])}"]
+    for name, stage in record['stages'].items():
+        parts = _format_counters(stage['counters'])
+        for latency_name, latency in stage['latency'].items():
+            if latency['count'] > 1:
+                parts.append(f"{latency_name} p50 {_format_seconds(latency['p50'])} p95 {_format_seconds(latency['p95'])} "
+                             f"máx {_format_seconds(latency['max'])}")
+            else:
+                parts.append(f"{latency_name} {_format_seconds(latency['total'])}")
+        if stage['status']:
+            parts.insert(0, stage['status'] + ('' if stage['wall_time'] is None else f" em {_format_seconds(stage['wall_time'])}"))
+        lines.append(f"  {name}: {', '.join(parts)}")
+    return lines
+
+def _change(before, after, formatter):
+    if before is None or after is None:
+        return f"{'-' if before is None else formatter(before)} -> {'-' if after is None else formatter(after)}"
+    percent = f" ({(after - before) / before * 100:+.0f}%)" if before else ''
+    return f"{formatter(before)} -> {formatter(after)}{percent}"
+
+def compare_runs(base, other):
+    """Return lines comparing two run records stage by stage: wall time, latencies and changed counters."""
+    lines = [f"Execução {base['run_id']} -> {other['run_id']}: {_change(base['duration'], other['duration'], _format_seconds)}"]
+    for name in dict.fromkeys([*base['stages'], *other['stages']]):
+        before = base['stages'].get(name, {'wall_time': None, 'counters': {}, 'latency': {}})
+        after = other['stages'].get(name, {'wall_time': None, 'counters': {}, 'latency': {}})
+        if before['wall_time'] is None and after['wall_time'] is None:
+            lines.append(f"  {name}:")
+        else:
+            lines.append(f"  {name}: {_change(before['wall_time'], after['wall_time'], _format_seconds)}")
+        for latency_name in dict.fromkeys([*before['latency'], *after['latency']]):
+            p95 = [stage['latency'].get(latency_name, {}).get('p95') for stage in (before, after)]
+            lines.append(f"    {latency_name} p95: {_change(*p95, _format_seconds)}")
+        for counter in dict.fromkeys([*before['counters'], *after['counters']]):
+            values = [stage['counters'].get(counter, 0) for stage in (before, after)]
+            if values[0] != values[1]:
+                formatter = _format_bytes if counter.startswith('bytes') else str
+                lines.append(f"    {counter}: {_change(*values, formatter)}")
+    return lines
@@ -0,0 +1,219 @@
+"""Headless entry point for the Sakana Tool pipeline.
+
+Examples:
+    python sakana_cli.py                          # every stage once
+    python sakana_cli.py gestor compras excel     # a subset of the stages
+    python sakana_cli.py scan_gestor --downstream # a stage and everything after it
+    python sakana_cli.py --watch --interval 10    # run again whenever XMLs or PDFs arrive
+    python sakana_cli.py --stream                 # extract XMLs while the scan is finding them
+    python sakana_cli.py merge --path mesc=/mnt/registro --dry-run
+    python sakana_cli.py --history 5              # summaries of the last five runs
+    python sakana_cli.py --compare                # last run against the one before it
+    python sakana_cli.py --compare 20240301 20240302-0815
+
+Ctrl+C stops the stages at their next checkpoint, after they save their
+progress; the next run resumes from there. A second Ctrl+C exits at once,
+without waiting for the stages; the next run redoes what they did since
+their last checkpoint.
+"""
+import os
+import sys
+import time
+import signal
+import argparse
+import multiprocessing
+from datetime import datetime
+from config_tools import DIR
+from event_sink import configure_logging
+from directory_scanner import FileInventory
+from pipeline import Pipeline
+from run_metrics import load_runs, find_run, format_run, compare_runs
+
+WATCHED_EXTENSIONS = ('.xml', '.pdf')
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Runs the Sakana Tool pipeline without the GUI.",
+        epilog=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('stages', nargs='*', metavar='stage',
+                        help=f"Stages to run (default: all): {', '.join(Pipeline.STAGES)}")
+    parser.add_argument('--downstream', action='store_true',
+                        help="Also run every stage that depends on the given ones")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help="Processes used by each XML extraction (default: %(default)s)")
+    parser.add_argument('--merge-workers', type=int, default=4,
+                        help="PDF merges run concurrently (default: %(default)s)")
+    parser.add_argument('--stream', action='store_true',
+                        help="Extract XMLs while the scan is still finding them; the new files CSVs become checkpoints")
+    parser.add_argument('--path', action='append', default=[], metavar='KEY=VALUE',
+                        help="Override a path of config_tools.DIR, e.g. --path mesc=/mnt/registro")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="Show the stages and paths that would be used, without running them")
+    parser.add_argument('--watch', action='store_true',
+                        help="Keep running and start the stages again when XMLs or PDFs are added or changed")
+    parser.add_argument('--interval', type=float, default=5.0,
+                        help="Seconds between checks in watch mode (default: %(default)s)")
+    parser.add_argument('--history', type=int, metavar='N',
+                        help="Show the metrics of the last N runs instead of running stages")
+    parser.add_argument('--compare', nargs='*', metavar='RUN',
+                        help="Compare two runs by id or id prefix (default: the last two) instead of running stages")
+    args = parser.parse_args(argv)
+    unknown = [stage for stage in args.stages if stage not in Pipeline.STAGES]
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(unknown)}")
+    if args.history is not None and args.history < 1:
+        parser.error("--history takes a number of runs greater than 0")
+    return args
+
+def build_config(overrides):
+    """Return a DIR with the KEY=VALUE overrides applied; relative values are taken from the working directory."""
+    path_to = DIR()
+    for override in overrides:
+        key, sep, value = override.partition('=')
+        if not sep or key not in path_to.dirs:
+            raise SystemExit(f"Invalid --path '{override}'; known keys: {', '.join(path_to.dirs)}")
+        path_to.dirs[key] = os.path.abspath(value)
+    path_to.update_paths()
+    return path_to
+
+def print_event(event):
+    if event.kind == 'log':
+        print(event.data)
+    elif event.kind == 'run_metrics':
+        print('\n'.join(format_run(event.data)))
+    elif event.kind == 'stage_failed':
+        print(f"[{event.stage}] falhou: {event.data}")
+    elif event.kind in ('stage_started', 'stage_finished', 'stage_skipped', 'stage_cancelled'):
+        print(f"[{event.stage}] {event.kind[len('stage_'):]}")
+
+def watched_roots(path_to):
+    return [path_to.xml_data, path_to.gestor_data, path_to.chNTR_data]
+
+def snapshot(inventory):
+    """Return the set of XML and PDF entries of the inventory; any change in size or mtime changes it."""
+    return {
+        entry for root in inventory.roots for entry in inventory.entries[root]
+        if entry.name.lower().endswith(WATCHED_EXTENSIONS)
+    }
+
+def run_once(path_to, stages, args, inventory=None):
+    """Run the stages once and return the dict of stage -> status.
+
+    The first Ctrl+C cancels the pipeline. A second one ends the process with
+    os._exit(130): raising KeyboardInterrupt would not, since the interpreter
+    still joins the executor threads and extraction workers before exiting.
+    The caches are not saved then, as a stage may be halfway through updating
+    them; what is on disk is the last checkpoint, which the next run resumes.
+    """
+    pipeline = Pipeline(
+        path_to, workers=args.workers, merge_workers=args.merge_workers, inventory=inventory, streaming=args.stream
+    )
+    pipeline.subscribe(print_event)
+
+    def cancel(signum, frame):
+        if pipeline.cancel_token.cancelled:
+            print("Interrompido.", flush=True)
+            os._exit(130)
+        pipeline.cancel()
+
+    previous_handler = signal.signal(signal.SIGINT, cancel)
+    try:
+        return pipeline.run(stages)
+    finally:
+        signal.signal(signal.SIGINT, previous_handler)
+
+def exit_status(results):
+    """Return 130 if the run was cancelled, 1 if a stage failed and 0 otherwise."""
+    if 'cancelled' in results.values():
+        return 130
+    return 1 if 'failed' in results.values() else 0
+
+def watch(path_to, stages, args):
+    """Run the stages, then poll the document folders and run them again after every change.
+
+    Polling uses the scanner's cached directory listings, so a check costs about
+    one stat per unchanged directory; file-system notifications are not used
+    because they are not delivered for the shared and network drives the
+    documents live on.
+    """
+    print(f"Observando {', '.join(sorted(set(watched_roots(path_to))))} a cada {args.interval}s (Ctrl+C para sair)")
+    last = None
+    while True:
+        inventory = FileInventory(watched_roots(path_to), path_to.scan_state).build(verbose=False)
+        current = snapshot(inventory)
+        if current != last:
+            if last is not None:
+                print(f"{datetime.now():%Y-%m-%d %H:%M:%S} {len(current - last)} arquivos novos ou alterados")
+            results = run_once(path_to, stages, args, inventory)
+            # Ctrl+C during a run cancels it; it ends the watch like one between runs
+            if 'cancelled' in results.values():
+                raise KeyboardInterrupt
+            last = current
+        time.sleep(args.interval)
+
+def show_metrics(path_to, history=None, compare=None):
+    """Print saved run records: the last `history` runs, or a comparison of two runs."""
+    runs = load_runs(path_to.run_metrics)
+    if compare is None:
+        for run in runs[-history:]:
+            print('\n'.join(format_run(run)))
+        return 0 if runs else 1
+
+    if len(compare) > 2:
+        raise SystemExit("--compare takes at most two runs")
+    selected = [find_run(runs, run_id) for run_id in compare]
+    for run_id, run in zip(compare, selected):
+        if run is None:
+            raise SystemExit(f"Execução não encontrada: {run_id}")
+    # Missing runs are taken from the end of the history: the newest, then the one before it
+    if len(selected) == 1:
+        selected.append(runs[-1] if runs else None)
+    elif not selected:
+        selected = runs[-2:]
+    if len(selected) < 2 or None in selected:
+        print(f"São necessárias duas execuções em {path_to.run_metrics}")
+        return 1
+    print('\n'.join(compare_runs(*selected)))
+    return 0
+
+def main(argv=None):
+    args = parse_args(argv)
+    path_to = build_config(args.path)
+    if args.history is not None or args.compare is not None:
+        return show_metrics(path_to, args.history, args.compare)
+    stages = args.stages or list(Pipeline.STAGES)
+    if args.downstream:
+        stages = Pipeline.downstream(stages)
+    stages = [stage for stage in Pipeline.STAGES if stage in stages]
+
+    if args.dry_run:
+        for stage in stages:
+            dependencies = [dep for dep in Pipeline.STAGES[stage][1] if dep in stages]
+            streamed = Pipeline.STREAMS.get(stage) if args.stream else None
+            if streamed in dependencies:
+                print(f"{stage} (junto com {streamed})")
+            else:
+                print(f"{stage}" + (f" (após {', '.join(dependencies)})" if dependencies else ''))
+        for key in path_to.dirs:
+            print(f"  {key} = {getattr(path_to, key)}")
+        if args.watch:
+            print(f"Observaria {', '.join(sorted(set(watched_roots(path_to))))} a cada {args.interval}s")
+        return 0
+
+    listener = configure_logging(path_to.app_log)
+    try:
+        if args.watch:
+            try:
+                watch(path_to, stages, args)
+            except KeyboardInterrupt:
+                print("Observação encerrada.")
+            return 0
+        return exit_status(run_once(path_to, stages, args))
+    finally:
+        listener.stop()
+
+if __name__ == "__main__":
+    # Required for the process pool used by XML extraction in the frozen executable
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,57 @@
+import io
+import os
+
+import pandas as pd
+
+from pdf_merge_routines import plan_merges
+
+CHNF = '35240112345678000199550010000012341000012345'
+CHNTR = '35240198765432000199570010000056781000056789'
+COLUMNS = ('chNF', 'chNTR', 'out', 'Ano', 'Municipio', 'FOR', 'Valor', 'nNF')
+
+def combined_table(rows):
+    """Return the rows as find_and_merge_pdfs reads them, through an Excel file."""
+    buffer = io.BytesIO()
+    pd.DataFrame(rows).to_excel(buffer, index=False)
+    buffer.seek(0)
+    return pd.read_excel(buffer)
+
+def plan(df, pdf_maps=({CHNF: '/gestor/a.pdf'}, {CHNTR: '/chntr/b.pdf'}, {})):
+    return plan_merges(df, pdf_maps, *COLUMNS, abbrev_length=3)
+
+def test_plan_names_rows_with_missing_for_valor_and_ano():
+    df = combined_table([
+        {'chNF': CHNF, 'chNTR': CHNTR, 'Ano': 2024, 'Municipio': 'Santos', 'FOR': 'Fornecedor',
+         'Valor': 1234.5, 'nNF': 1234},
+        {'chNF': CHNF[:-1] + '6', 'chNTR': CHNTR, 'Ano': None, 'Municipio': 'Santos', 'FOR': None,
+         'Valor': None, 'nNF': None},
+    ])
+    pdf_maps = ({CHNF: '/gestor/a.pdf', CHNF[:-1] + '6': '/gestor/c.pdf'}, {CHNTR: '/chntr/b.pdf'}, {})
+
+    merge_plan, missing, invalid = plan(df, pdf_maps)
+
+    assert missing.empty and invalid.empty
+    assert list(merge_plan['output_filename']) == [
+        f'FOR_1234_{CHNF[-8:]}_{CHNTR[-8:]}_1234-50.pdf',
+        f'NAN_sem-numero_{CHNF[-8:-1]}6_{CHNTR[-8:]}_nan.pdf',
+    ]
+    assert list(merge_plan['output_path']) == [
+        os.path.join('out', '2024', 'Santos', f'FOR_1234_{CHNF[-8:]}_{CHNTR[-8:]}_1234-50.pdf'),
+        os.path.join('out', 'nan', 'Santos', f'NAN_sem-numero_{CHNF[-8:-1]}6_{CHNTR[-8:]}_nan.pdf'),
+    ]
+
+def test_plan_skips_merged_outputs_and_reports_rows_without_pdfs():
+    df = combined_table([
+        {'chNF': CHNF, 'chNTR': CHNTR, 'Ano': 2024, 'Municipio': 'Santos', 'FOR': 'Fornecedor',
+         'Valor': 10, 'nNF': 1},
+        {'chNF': 'sem-pdf', 'chNTR': 'sem-pdf', 'Ano': 2024, 'Municipio': 'Santos', 'FOR': 'Fornecedor',
+         'Valor': 10, 'nNF': 2},
+    ])
+
+    merge_plan, missing, invalid = plan_merges(
+        df, ({CHNF: '/gestor/a.pdf'}, {CHNTR: '/chntr/b.pdf'}, {}), *COLUMNS,
+        abbrev_length=3, already_merged={f'FOR_1_{CHNF[-8:]}_{CHNTR[-8:]}_10-00.pdf'}
+    )
+
+    assert merge_plan.empty and invalid.empty
+    assert list(missing.index) == [1]
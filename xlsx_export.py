@@ -0,0 +1,104 @@
+import os
+import shutil
+import logging
+import warnings
+import tempfile
+import pandas as pd
+
+try:
+    import xlsxwriter
+except ImportError:  # Optional: streaming writer; openpyxl's write-only mode is used otherwise
+    xlsxwriter = None
+
+logger = logging.getLogger(__name__)
+
+TABLE_NAME = 'Datatable'
+
+def write_excel(df, file_path, table=False, sheet_name='Sheet1'):
+    """Write a DataFrame to an .xlsx file in a single streaming pass.
+
+    The workbook is built in a local temporary file and then moved over file_path,
+    so readers of the shared drive never see a half-written file.
+
+    :param table: Format the data as the styled "Datatable" Excel table.
+    """
+    fd, temp_path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    try:
+        header = [str(col) for col in df.columns]
+        # Python objects with None for missing values; NaN is not a valid cell value
+        rows = df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+        if xlsxwriter is not None:
+            _write_xlsxwriter(temp_path, sheet_name, header, rows, len(df), table)
+        else:
+            _write_openpyxl(temp_path, sheet_name, header, rows, len(df), table)
+        replace_file(temp_path, file_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def replace_file(source_path, file_path):
+    """Copy source_path next to file_path and rename it into place in one step."""
+    os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+    partial_path = file_path + '.partial'
+    try:
+        shutil.copyfile(source_path, partial_path)
+        os.replace(partial_path, file_path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+
+def _write_xlsxwriter(path, sheet_name, header, rows, row_count, table):
+    # Constant memory mode flushes each row as it is written but cannot hold tables
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': not table})
+    try:
+        worksheet = workbook.add_worksheet(sheet_name)
+        if table and row_count:
+            worksheet.add_table(0, 0, row_count, len(header) - 1, {
+                'name': TABLE_NAME,
+                'style': 'Table Style Medium 9',
+                'banded_rows': True,
+                'banded_columns': True,
+                'columns': [{'header': name} for name in header],
+            })
+        else:
+            worksheet.write_row(0, 0, header)
+        for row_number, row in enumerate(rows, start=1):
+            worksheet.write_row(row_number, 0, row)
+    finally:
+        workbook.close()
+
+def _write_openpyxl(path, sheet_name, header, rows, row_count, table):
+    from openpyxl import Workbook
+    from openpyxl.utils import get_column_letter
+    from openpyxl.worksheet.table import Table, TableColumn, TableStyleInfo
+
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet(sheet_name)
+    worksheet.append(header)
+    for row in rows:
+        worksheet.append(row)
+    if table and row_count:
+        excel_table = Table(displayName=TABLE_NAME, ref=f"A1:{get_column_letter(len(header))}{row_count + 1}")
+        # Write-only sheets cannot be read back to name the columns from the header
+        excel_table.tableColumns = [TableColumn(id=i, name=name) for i, name in enumerate(header, start=1)]
+        excel_table.tableStyleInfo = TableStyleInfo(
+            name="TableStyleMedium9",
+            showFirstColumn=False,
+            showLastColumn=False,
+            showRowStripes=True,
+            showColumnStripes=True,
+        )
+        with warnings.catch_warnings():
+            # openpyxl warns on every write-only table, even with the columns already set
+            warnings.simplefilter('ignore', UserWarning)
+            worksheet.add_table(excel_table)
+    workbook.save(path)
+
+def transform_to_table(file_path):
+    """Rewrite an existing .xlsx file with its first sheet formatted as the "Datatable" table."""
+    try:
+        write_excel(pd.read_excel(file_path), file_path, table=True)
+        logger.info(f"Tabela Criada com Sucesso em {file_path}")
+    except Exception as e:
+        logger.error(f"Erro ao criar tabela! {e}")
@@ -1,15 +1,39 @@
 import os
 import csv
+import hashlib
 from datetime import datetime
 from config_tools import DIR
-import pandas as pd
+from directory_scanner import DirectoryScanner, FileInventory
+from run_metrics import StageMetrics
 import re
 
+# Event files ("-procEvento...NFe.xml") carry no invoice data and are never extracted
+PROC_EVENTO_PATTERN = re.compile(r'-procEvento.*NFe\.xml$', re.IGNORECASE)
+
+# Columns of the new files CSV read by XMLProcessor.load_new_files_list
+NEW_FILES_FIELDS = ['file_name', 'file_path', 'timestamp']
+
+try:
+    import xxhash
+except ImportError:  # Optional: faster content hashing when installed
+    xxhash = None
+
 class CacheCreator:
-    """Manages the file metadata cache for efficient XML processing."""
+    """Manages the file metadata cache for efficient XML processing.
 
-    def __init__(self, cache_file):
+    Entries are keyed by full path and hold size, mtime_ns and an optional content
+    hash, so a file is only reported again when its content really changed. The
+    hash is taken lazily, the first time a file's mtime moves while its size stays
+    the same, so new and migrated files are not read by the scan.
+    """
+
+    FIELDNAMES = ['file_path', 'file_name', 'size', 'mtime_ns', 'timestamp', 'content_hash']
+
+    def __init__(self, cache_file, use_hash=True):
         self.cache_file = cache_file
+        self.use_hash = use_hash
+        # Entries of the old basename/timestamp cache, honoured until the file is seen again
+        self.legacy_data = {}
         self.cache_data = self.load_cache()
 
     def load_cache(self):
@@ -17,91 +41,264 @@ class CacheCreator:
         cache_data = {}
         if os.path.exists(self.cache_file):
             try:
-                with open(self.cache_file, 'r') as f:
+                with open(self.cache_file, 'r', newline='') as f:
                     reader = csv.DictReader(f)
                     for row in reader:
-                        cache_data[row['file_name']] = row['timestamp']
+                        if not row.get('file_path'):
+                            self.legacy_data[row['file_name']] = row['timestamp']
+                            continue
+                        cache_data[row['file_path']] = {
+                            'file_name': row['file_name'],
+                            'size': int(row['size']),
+                            'mtime_ns': int(row['mtime_ns']),
+                            'timestamp': row['timestamp'],
+                            'content_hash': row['content_hash'] or None,
+                        }
             except Exception as e:
                 print(f"Error loading cache from CSV: {e}")
         return cache_data
 
     def save_cache(self):
-        """Save the current cache data to a CSV file."""
+        """Save the current cache data to a CSV file.
+
+        The data is written to a temporary file that then replaces the cache, so a
+        run stopped during a checkpoint leaves the previous cache intact.
+        """
+        temp_file = self.cache_file + '.tmp'
         try:
-            with open(self.cache_file, 'w', newline='') as f:
-                writer = csv.DictWriter(f, fieldnames=['file_name', 'timestamp'])
+            os.makedirs(os.path.dirname(os.path.abspath(self.cache_file)), exist_ok=True)
+            with open(temp_file, 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=self.FIELDNAMES)
                 writer.writeheader()
-                for file_name, timestamp in self.cache_data.items():
+                for file_path, entry in self.cache_data.items():
+                    writer.writerow({'file_path': file_path, **entry})
+                for file_name, timestamp in self.legacy_data.items():
                     writer.writerow({'file_name': file_name, 'timestamp': timestamp})
+            os.replace(temp_file, self.cache_file)
         except Exception as e:
             print(f"Error saving cache to CSV: {e}")
 
-    def is_file_new_or_modified(self, file_name, timestamp):
-        """Check if the file is new or has been modified."""
-        return file_name not in self.cache_data or self.cache_data[file_name] != timestamp
+    @staticmethod
+    def hash_file(file_path, block_size=1024 * 1024):
+        """Return a fast content hash of the file (xxh3-128 if available, else blake2b-128)."""
+        digest = xxhash.xxh3_128() if xxhash else hashlib.blake2b(digest_size=16)
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def is_file_new_or_modified(self, file_path, stat_result):
+        """Check if the file is new or its content has changed.
+
+        Size and mtime_ns are compared first; when only the mtime moved (e.g. a
+        Drive re-sync), the content hash decides, and an unchanged file just has
+        its cached mtime refreshed. An entry without a hash yet is reported as
+        changed and gets the hash, so the next re-sync of the file is recognised.
+
+        :raises OSError: The file could not be read for hashing, e.g. it was removed
+                         or locked after it was listed.
+        """
+        entry = self.cache_data.get(file_path)
+        if entry is None:
+            file_name = os.path.basename(file_path)
+            timestamp = datetime.fromtimestamp(stat_result.st_mtime).isoformat()
+            if self.legacy_data.get(file_name) == timestamp:
+                del self.legacy_data[file_name]
+                self.update_cache(file_path, stat_result)
+                return False
+            return True
 
-    def update_cache(self, file_name, timestamp):
-        """Update the cache with the latest timestamp for the file."""
-        self.cache_data[file_name] = timestamp
+        if entry['size'] != stat_result.st_size:
+            return True
+        if entry['mtime_ns'] == stat_result.st_mtime_ns:
+            return False
+        if not self.use_hash:
+            return True
+
+        content_hash = self.hash_file(file_path)
+        changed = content_hash != entry['content_hash']
+        self.update_cache(file_path, stat_result, content_hash)
+        return changed
+
+    def update_cache(self, file_path, stat_result, content_hash=None):
+        """Update the cache with the latest size, mtime and content hash for the file.
+
+        Without a content_hash, the cached one is kept if size and mtime are unchanged
+        and left empty otherwise; is_file_new_or_modified fills it in when needed.
+        """
+        if content_hash is None:
+            entry = self.cache_data.get(file_path)
+            if entry and entry['size'] == stat_result.st_size and entry['mtime_ns'] == stat_result.st_mtime_ns:
+                content_hash = entry['content_hash']
+        self.cache_data[file_path] = {
+            'file_name': os.path.basename(file_path),
+            'size': stat_result.st_size,
+            'mtime_ns': stat_result.st_mtime_ns,
+            'timestamp': datetime.fromtimestamp(stat_result.st_mtime).isoformat(),
+            'content_hash': content_hash,
+        }
 
 class XMLreading:
-    """Processes XML files and handles caching of file metadata."""
+    """Processes XML files and handles caching of file metadata.
+
+    New files are appended to a new files CSV that the extraction clears once it
+    has stored them. The cache is saved every CHECKPOINT_FILES files, after the
+    files found so far are flushed to that CSV, so a scan that is cancelled or
+    crashes neither loses nor repeats the files it already went through.
+    """
+
+    # Files checked between two saves of the cache
+    CHECKPOINT_FILES = 1000
 
-    def __init__(self, directory, cache_file):
+    def __init__(self, directory, cache_file, use_hash=True, state_file=None, max_workers=8, prune_unchanged=True):
         self.directory = directory
-        self.cache = CacheCreator(cache_file)
+        self.cache = CacheCreator(cache_file, use_hash=use_hash)
+        self.state_file = state_file
+        self.max_workers = max_workers
+        self.prune_unchanged = prune_unchanged
 
     def get_file_metadata(self, file_path):
-        """Retrieve the last modification timestamp and file name of a file."""
+        """Retrieve the stat result and file name of a file."""
         try:
-            mtime = os.path.getmtime(file_path)
-            timestamp = datetime.fromtimestamp(mtime).isoformat()
-            file_name = os.path.basename(file_path)
-            return file_name, timestamp
+            return os.path.basename(file_path), os.stat(file_path)
         except Exception as e:
             print(f"Error retrieving metadata for file {file_path}: {e}")
             return None, None
 
-    def scan_for_new_files(self):
-        """Scan the directory for new or modified XML files."""
-        new_files = []
-        for root, dirs, files in os.walk(self.directory):
-            for file in files:
-                if file.lower().endswith('.xml'):
-                    # Skip files containing "-procEvento" followed by "NFe.xml" at the end
-                    if re.search(r'-procEvento.*NFe\.xml$', file, re.IGNORECASE):
-                        continue
-                    
-                    file_path = os.path.join(root, file)
-                    file_name, timestamp = self.get_file_metadata(file_path)
-                    if file_name and self.cache.is_file_new_or_modified(file_name, timestamp):
-                        new_files.append({'file_name': file_name, 'file_path': file_path, 'timestamp': timestamp})
-                        self.cache.update_cache(file_name, timestamp)
-        return new_files
-
-    def process_new_files(self, csv_file):
-        """Process new or modified XML files and save the details to a CSV file."""
-        new_files = self.scan_for_new_files()
-        
-        # Filter out files containing "-procEvento" in their names
-        filtered_files = [
-            file for file in new_files 
-            if not re.search(r'-procEvento.*NFe\.xml$', file['file_name'], re.IGNORECASE)
-        ]
-        
-        if filtered_files:
+    def scan_for_new_files(self, inventory=None, metrics=None, cancel=None):
+        """Scan the directory for new or modified XML files.
+
+        :param inventory: FileInventory shared with other stages; when omitted the
+                          directory is walked on its own.
+        """
+        if inventory is None:
+            inventory = FileInventory([self.directory], self.state_file, self.max_workers, self.prune_unchanged).build()
+        return list(self.iter_new_files(inventory, metrics, cancel))
+
+    def iter_new_files(self, inventory=None, metrics=None, cancel=None, checkpoint=None):
+        """Yield a {'file_name', 'file_path', 'timestamp'} dict for each new or modified XML file.
+
+        Without an inventory the directory is walked here and files are yielded as
+        each directory is read, so a consumer can start on them during the walk.
+
+        :param metrics: StageMetrics receiving the file counts, cache hits and the
+                        time spent checking each file against the cache.
+        :param cancel: Optional CancelToken, checked before each file.
+        :param checkpoint: Called every CHECKPOINT_FILES files, when every file yielded
+                           so far has been taken by the consumer.
+        """
+        if metrics is None:
+            metrics = StageMetrics()
+        if inventory is not None:
+            entries = inventory.files(self.directory, '.xml')
+        else:
+            scanner = DirectoryScanner(self.directory, self.state_file, self.max_workers, self.prune_unchanged)
+            entries = (entry for entry in scanner.iter_files() if entry.name.lower().endswith('.xml'))
+
+        checked = 0
+        for entry in entries:
+            if cancel is not None:
+                cancel.check()
+            # Skip files containing "-procEvento" followed by "NFe.xml" at the end
+            if PROC_EVENTO_PATTERN.search(entry.name):
+                continue
+
+            checked += 1
+            if checkpoint is not None and checked % self.CHECKPOINT_FILES == 0:
+                checkpoint()
+            metrics.count('files_seen')
             try:
-                with open(csv_file, 'w', newline='') as f:
-                    writer = csv.DictWriter(f, fieldnames=['file_name', 'file_path', 'timestamp'])
-                    writer.writeheader()
-                    writer.writerows(filtered_files)
+                with metrics.timed('file_check'):
+                    is_new = self.cache.is_file_new_or_modified(entry.path, entry)
+                    if is_new:
+                        self.cache.update_cache(entry.path, entry)
+            except OSError as e:
+                # Removed or locked since it was listed; it is checked again on the next scan
+                print(f"Error checking file {entry.path}: {e}")
+                metrics.count('errors')
+                continue
+            if not is_new:
+                metrics.count('file_cache_hits')
+                continue
+
+            metrics.count('file_cache_misses')
+            metrics.count('bytes_new', entry.st_size)
+            timestamp = self.cache.cache_data[entry.path]['timestamp']
+            yield {'file_name': entry.name, 'file_path': entry.path, 'timestamp': timestamp}
+
+        if inventory is None:
+            scanner.save_state()
+            metrics.count('listing_hits', scanner.stats['pruned'])
+            metrics.count('listing_misses', scanner.stats['listed'])
+            metrics.count('errors', scanner.stats['errors'])
+
+    def pending_files(self, csv_file):
+        """Return the paths left in the new files CSV by scans whose files were not extracted yet."""
+        if not csv_file or not os.path.exists(csv_file):
+            return []
+        try:
+            with open(csv_file, 'r', newline='') as f:
+                return [row['file_path'] for row in csv.DictReader(f) if row.get('file_path')]
+        except Exception as e:
+            print(f"Error reading pending files from CSV: {e}")
+            return []
+
+    def iter_checkpointed_files(self, csv_file, inventory=None, metrics=None, cancel=None):
+        """Yield each new or modified XML file while appending it to csv_file and checkpointing the cache.
+
+        The cache is saved every CHECKPOINT_FILES files and when the scan stops for
+        any reason, each time after the files found so far are flushed to the CSV.
+        """
+        found = 0
+        output = writer = None
+
+        def checkpoint():
+            if output:
+                output.flush()
+            self.cache.save_cache()
+
+        try:
+            for file in self.iter_new_files(inventory, metrics, cancel, checkpoint):
+                if csv_file and output is None:
+                    os.makedirs(os.path.dirname(os.path.abspath(csv_file)), exist_ok=True)
+                    is_new = not os.path.exists(csv_file) or os.path.getsize(csv_file) == 0
+                    output = open(csv_file, 'a', newline='')
+                    writer = csv.DictWriter(output, fieldnames=NEW_FILES_FIELDS)
+                    if is_new:
+                        writer.writeheader()
+                if writer:
+                    writer.writerow(file)
+                found += 1
+                yield file
+        finally:
+            if output:
+                output.close()
                 print(f"New file details saved to: {csv_file}")
-            except Exception as e:
-                print(f"Error saving new files to CSV: {e}")
-        else:
+            self.cache.save_cache()
+
+        if not found:
             print("No new or modified files found (excluding files with '-procEvento' in the name).")
-        
-        self.cache.save_cache()
+
+    def stream_new_files(self, csv_file=None, inventory=None, metrics=None, cancel=None):
+        """Yield the path of each new or modified XML file as soon as it is found.
+
+        :param csv_file: Optional checkpoint; the files are also appended to it as they
+                         are found, in the format read by XMLProcessor.load_new_files_list.
+                         Files it still lists from an earlier run are yielded first.
+        """
+        pending = self.pending_files(csv_file)
+        if pending:
+            print(f"Retomando {len(pending)} arquivos pendentes de {csv_file}")
+            if metrics is not None:
+                metrics.count('resumed', len(pending))
+        yield from pending
+        for file in self.iter_checkpointed_files(csv_file, inventory, metrics, cancel):
+            yield file['file_path']
+
+    def process_new_files(self, csv_file, inventory=None, metrics=None, cancel=None):
+        """Process new or modified XML files and append their details to a CSV file."""
+        for _ in self.iter_checkpointed_files(csv_file, inventory, metrics, cancel):
+            pass
     
 class CacheOperations:
     """Manages cache-related tasks."""
@@ -124,8 +321,10 @@ class CacheOperations:
 if __name__ == "__main__":
 
     path_to = DIR()
+    inventory = FileInventory([path_to.xml_data, path_to.gestor_data], path_to.scan_state).build()
+
     processor = XMLreading(path_to.xml_data, path_to.cache_compras)
-    processor.process_new_files(path_to.new_compras)
+    processor.process_new_files(path_to.new_compras, inventory)
 
     gestor_processor = XMLreading(path_to.gestor_data,path_to.cache_gestor)
-    gestor_processor.process_new_files(path_to.new_gestor)
\ No newline at end of file
+    gestor_processor.process_new_files(path_to.new_gestor, inventory)
\ No newline at end of file
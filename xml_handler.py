@@ -3,10 +3,56 @@ import xml.etree.ElementTree as ET
 import csv
 import pandas as pd
 import re
+import time
+import queue
 import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from config_tools import DIR
-from openpyxl import load_workbook
-from openpyxl.worksheet.table import Table, TableStyleInfo
+from record_store import RecordStore
+from nfe_records import GestorRecord, ComprasRecord, RECORD_TYPES
+from access_keys import first_access_key
+from run_metrics import StageMetrics
+from cancellation import Cancelled
+import xlsx_export
+
+logger = logging.getLogger(__name__)
+
+class ProcessedIndex:
+    """Set of file keys already extracted, with counters for the current run."""
+
+    # Column of the stored data holding the file name key for each extraction type
+    KEY_COLUMNS = {'gestor': 'chNTR', 'compras': 'file_name'}
+
+    def __init__(self, keys=()):
+        self.keys = set(keys)
+        self.skipped = 0
+        self.parsed = 0
+
+    @classmethod
+    def from_dataframe(cls, existing_data, extraction_type='gestor'):
+        """Build the index from previously extracted data loaded as a DataFrame."""
+        return cls(existing_data[cls.KEY_COLUMNS[extraction_type]].tolist())
+
+    @classmethod
+    def from_store(cls, store, extraction_type='gestor'):
+        """Build the index from the keys persisted in a RecordStore."""
+        return cls(store.keys(extraction_type))
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, key):
+        self.keys.add(key)
+
+    def summary(self):
+        """Return a one-line report of how many candidates were skipped and parsed."""
+        return f"Index: {self.skipped} files skipped as already processed, {self.parsed} parsed ({len(self.keys)} keys indexed)."
+
 
 class XMLProcessor:
     """Process XML files to extract specific elements and save them to an Excel file."""
@@ -14,65 +60,127 @@ class XMLProcessor:
     def __init__(self, namespaces=None):
         # Define namespaces (if applicable)
         self.namespaces = namespaces or {'nfe': 'http://www.portalfiscal.inf.br/nfe'}
+        # Bytes fed to the parser so far; reading stops early, so usually less than the file sizes
+        self.bytes_read = 0
+
+    # Fields read by each extraction type: name -> (enclosing nfe element, child path).
+    # The child is looked up when the enclosing element closes, mirroring the former
+    # './/nfe:a/nfe:b' searches without rescanning the document.
+    GESTOR_FIELDS = {
+        'nNF': ('ide', 'nfe:nNF'),
+        'dhEmi': ('ide', 'nfe:dhEmi'),
+        # ElementTree elements without children are falsy, so the old
+        # `find(xFant) or find(xNome)` always resolved to the first xNome (the
+        # emitter's). Keep that value so FOR prefixes of merged files do not change.
+        'xFant': ('emit', 'nfe:xNome'),
+    }
+    COMPRAS_FIELDS = {
+        'chNFe': ('infProt', 'nfe:chNFe'),
+        'xMun': ('enderDest', 'nfe:xMun'),
+        'infCpl': ('infAdic', 'nfe:infCpl'),
+        'vProd': ('ICMSTot', 'nfe:vProd'),
+    }
+
+    _ITEM_START = re.compile(rb'<(?:[\w.-]+:)?det[\s>]')
+    _ITEM_END_PREFIX = re.compile(rb'</(?:[\w.-]+:)?$')
 
     def extract_data_from_xml(self, xml_file, extraction_type='gestor'):
-        """Extract data from XML file based on the specified extraction type."""
-        try:
-            tree = ET.parse(xml_file)
-            root = tree.getroot()
+        """Extract data from XML file based on the specified extraction type.
 
+        Returns a GestorRecord or ComprasRecord with typed values, or None if the file cannot be parsed.
+        """
+        try:
             if extraction_type == 'gestor':
-                return self._extract_gestor_data(root)
+                return self._extract_gestor_data(xml_file)
             elif extraction_type == 'compras':
-                return self._extract_compras_data(root, xml_file)
+                return self._extract_compras_data(xml_file)
         except ET.ParseError:
-            print(f"Error parsing XML file: {xml_file}")
+            logger.warning(f"Error parsing XML file: {xml_file}")
             return None
 
-    def _extract_gestor_data(self, root):
-        """Extract <nNF>, <dhEmi>, and <xFant> elements for Gestor."""
-        nnf_element = root.find('.//nfe:nNF', self.namespaces)
-        nnf_text = nnf_element.text if nnf_element is not None else None
-
-        dhEmi_element = root.find('.//nfe:dhEmi', self.namespaces)
-        dhEmi_text = dhEmi_element.text[:4] if dhEmi_element is not None and dhEmi_element.text is not None else None
+    def stream_fields(self, xml_file, fields, skip_items=False, chunk_size=16 * 1024):
+        """Collect the requested fields in one forward pass over the XML file.
 
-        xFant_element = root.find('.//nfe:xFant', self.namespaces) or root.find('.//nfe:xNome', self.namespaces)
-        xFant_text = xFant_element.text if xFant_element is not None else None
-
-        return nnf_text, dhEmi_text, xFant_text
-
-    def _extract_compras_data(self, root, xml_file):
-        """Extract specific elements for Compras and use filename if chNTR is None."""
-        chNTR_element = root.find('.//nfe:protNFe/nfe:infProt/nfe:chNFe', self.namespaces)
-        chNTR_text = chNTR_element.text if chNTR_element is not None else None
+        The file is fed to a pull parser chunk by chunk and reading stops as soon as
+        every field has been found. With skip_items the <det> item list is cut out
+        before parsing, since no requested field lives inside it and it makes up
+        most of a large invoice; any <det> that still reaches the parser is cleared.
+        """
+        namespace = '{' + self.namespaces['nfe'] + '}'
+        fields_by_container = {}
+        for name, (container, child_path) in fields.items():
+            fields_by_container.setdefault(namespace + container, []).append((name, child_path))
+        item_tag = namespace + 'det'
+
+        found = {}
+        parser = ET.XMLPullParser(events=('end',))
+        with open(xml_file, 'rb') as f:
+            if skip_items:
+                chunks = [self._strip_items(f.read())]
+            else:
+                chunks = iter(lambda: f.read(chunk_size), b'')
+
+            for chunk in chunks:
+                self.bytes_read += len(chunk)
+                parser.feed(chunk)
+                for _, elem in parser.read_events():
+                    if elem.tag == item_tag:
+                        elem.clear()
+                        continue
+                    for name, child_path in fields_by_container.get(elem.tag, ()):
+                        if name not in found:
+                            found[name] = elem.findtext(child_path, None, self.namespaces)
+                    if len(found) == len(fields):
+                        return found
+        parser.close()
+        return found
+
+    def _strip_items(self, data):
+        """Remove the contiguous run of <det> elements from the raw XML bytes."""
+        first = self._ITEM_START.search(data)
+        if not first:
+            return data
+        end = len(data)
+        while True:
+            end = data.rfind(b'det>', first.end(), end)
+            if end == -1:
+                return data
+            if self._ITEM_END_PREFIX.search(data, max(first.end(), end - 64), end):
+                return data[:first.start()] + data[end + 4:]
+
+    def _extract_gestor_data(self, xml_file):
+        """Extract <nNF>, <dhEmi>, and <xFant> elements for Gestor as a GestorRecord."""
+        found = self.stream_fields(xml_file, self.GESTOR_FIELDS)
+        file_name_without_ext = os.path.splitext(os.path.basename(xml_file))[0]
+
+        return GestorRecord.from_text(file_name_without_ext, found.get('nNF'), found.get('dhEmi'), found.get('xFant'))
+
+    def _extract_compras_data(self, xml_file):
+        """Extract specific elements for Compras as a ComprasRecord and use filename if chNTR is None."""
+        found = self.stream_fields(xml_file, self.COMPRAS_FIELDS, skip_items=True)
+        file_name_without_ext = os.path.splitext(os.path.basename(xml_file))[0]
+
+        chNTR_text = found.get('chNFe')
 
         # Use filename without suffix "-nfe" if chNTR is None
         if not chNTR_text:
-            file_name_without_ext = os.path.splitext(os.path.basename(xml_file))[0]
             if file_name_without_ext.endswith("-nfe"):
                 chNTR_text = file_name_without_ext[:-4]  # Remove "-nfe" suffix
 
-        xMun_element = root.find('.//nfe:dest/nfe:enderDest/nfe:xMun', self.namespaces)
-        xMun_text = xMun_element.text if xMun_element is not None else None
+        xMun_text = found.get('xMun')
 
-        infCpl_element = root.find('.//nfe:infAdic/nfe:infCpl', self.namespaces)
-        infCpl_text = infCpl_element.text if infCpl_element is not None else None
+        # The purchase's NF-e key is referenced in the free-text additional information
+        extracted_number = first_access_key(found.get('infCpl'))
 
-        number_match = re.search(r'\b[^\s]{38,}\b', infCpl_text)  
-        if number_match:
-            extracted_number = re.sub(r'\D', '', number_match.group(0))
-        else:
-            extracted_number = None
+        vProd_text = found.get('vProd')
 
-        vProd_element = root.find('.//nfe:total/nfe:ICMSTot/nfe:vProd', self.namespaces)
-        vProd_text = vProd_element.text if vProd_element is not None else None
-
-        return extracted_number, chNTR_text, xMun_text, vProd_text
+        return ComprasRecord.from_text(file_name_without_ext, extracted_number, chNTR_text, xMun_text, vProd_text)
 
     def load_new_files_list(self, csv_file_path):
-        """Load the list of new XML files to process from a CSV file."""
+        """Load the list of new XML files to process from a CSV file; a missing file is an empty list."""
         new_files = []
+        if not os.path.exists(csv_file_path):
+            return new_files
         with open(csv_file_path, mode='r') as file:
             reader = csv.DictReader(file)
             for row in reader:
@@ -81,6 +189,11 @@ class XMLProcessor:
                     new_files.append(file_path)
         return new_files
 
+    def clear_new_files_list(self, csv_file_path):
+        """Remove the list of new XML files once all of them are stored, so the next scan starts a new one."""
+        if os.path.exists(csv_file_path):
+            os.remove(csv_file_path)
+
     def load_existing_data(self, excel_file_path, columns):
         """Load existing data from the Excel file if it exists."""
         if os.path.exists(excel_file_path):
@@ -88,63 +201,224 @@ class XMLProcessor:
         else:
             return pd.DataFrame(columns=columns)
 
-    def build_xml_file_mapping(self, new_files, existing_data, extraction_type='gestor'):
-        """Build a dictionary mapping XML file names to their extracted values, avoiding duplicates."""
-        if extraction_type == 'gestor':
-            columns = ['chNTR', 'nNF', 'dhEmi', 'xFant']
-        else:  # compras
-            columns = ['file_name', 'chNF', 'chNTR', 'xMun', 'vProd']
-
-        xml_data = {col: [] for col in columns}
-
-        # Configure logging
-        logging.basicConfig(filename='xml_processing.log', level=logging.ERROR, 
-                            format='%(asctime)s - %(levelname)s - %(message)s')
-
-        for xml_file_path in new_files:
-            if not os.path.exists(xml_file_path):
-                logging.error(f"File not found: {xml_file_path}")
-                continue
-
-            print(f"Processing file: {xml_file_path}")
-            file_name_without_ext = os.path.splitext(os.path.basename(xml_file_path))[0]
-
-            if extraction_type == 'gestor' and file_name_without_ext in existing_data['chNTR'].values:
-                print(f"File already processed: {file_name_without_ext}")
-                continue
-            elif extraction_type == 'compras' and file_name_without_ext in existing_data['file_name'].values:
-                print(f"File already processed: {file_name_without_ext}")
-                continue
-
-            try:
-                extracted_data = self.extract_data_from_xml(xml_file_path, extraction_type=extraction_type)
-
-                if extraction_type == 'gestor':
-                    nnf_text, dhEmi_text, xFant_text = extracted_data
-                    xml_data['chNTR'].append(file_name_without_ext)
-                    xml_data['nNF'].append(nnf_text)
-                    xml_data['dhEmi'].append(dhEmi_text)
-                    xml_data['xFant'].append(xFant_text)
-                else:  # compras
-                    extracted_number, chNTR_text, xMun_text, vProd_text = extracted_data
-                    xml_data['file_name'].append(file_name_without_ext)
-                    xml_data['chNF'].append(extracted_number)
-                    xml_data['chNTR'].append(chNTR_text)
-                    xml_data['xMun'].append(xMun_text)
-                    xml_data['vProd'].append(vProd_text)
-            except ValueError as e:
-                logging.error(f"Error extracting data from file {xml_file_path}: {str(e)}")
-                continue
-            except Exception as e:
-                logging.error(f"Unexpected error processing file {xml_file_path}: {str(e)}")
-                continue
+    def iter_extracted_data(self, xml_files, extraction_type='gestor', workers=None, chunk_size=256, metrics=None,
+                            cancel=None):
+        """Yield (xml_file, extracted_data, error) for each file, in input order.
+
+        With workers > 1 the files are split into chunks of chunk_size and parsed
+        in a process pool; otherwise they are parsed serially in this process.
+
+        :param metrics: StageMetrics receiving the files and bytes parsed, the errors
+                        and the parse time of each file.
+        :param cancel: Optional CancelToken, checked before each file, or each chunk
+                       with workers; chunks not started yet are dropped.
+        """
+        if metrics is None:
+            metrics = StageMetrics()
+        if not workers or workers <= 1 or len(xml_files) <= chunk_size:
+            for xml_file_path in xml_files:
+                if cancel is not None:
+                    cancel.check()
+                logger.debug(f"Processing file: {xml_file_path}")
+                yield from _record_timings(metrics, [_extract_one(self, xml_file_path, extraction_type)])
+            return
+
+        chunks = [xml_files[i:i + chunk_size] for i in range(0, len(xml_files), chunk_size)]
+        executor = ProcessPoolExecutor(max_workers=workers)
+        try:
+            # map() returns chunk results in submission order, keeping rows deterministic
+            results = executor.map(_extract_chunk, repeat(self.namespaces), chunks, repeat(extraction_type))
+            for chunk_number, chunk_results in enumerate(results, start=1):
+                if cancel is not None:
+                    cancel.check()
+                logger.debug(f"Processed chunk {chunk_number}/{len(chunks)} ({len(chunk_results)} files)")
+                yield from _record_timings(metrics, chunk_results)
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    def build_xml_file_mapping(self, new_files, existing_data, extraction_type='gestor', workers=None, chunk_size=256,
+                               metrics=None):
+        """Build a dictionary mapping XML file names to their extracted values, avoiding duplicates.
+
+        :param existing_data: ProcessedIndex of keys already extracted, or a DataFrame of the
+                              existing data from which the index is built.
+        :param workers: Number of worker processes used for parsing; None or 1 parses serially.
+        :param chunk_size: Number of files sent to a worker at a time.
+        :param metrics: Optional StageMetrics, as in iter_extracted_data.
+        """
+        xml_data = self._empty_records(extraction_type)
+        index = self._processed_index(existing_data, extraction_type)
+
+        pending_files = [xml_file_path for xml_file_path in new_files if self._claim(index, xml_file_path)]
+        logger.info(index.summary())
+
+        results = self.iter_extracted_data(pending_files, extraction_type, workers, chunk_size, metrics)
+        for xml_file_path, extracted_data, error in results:
+            self._add_record(xml_data, xml_file_path, extracted_data, error, extraction_type)
 
         return xml_data
 
+    def extract_to_store(self, new_files, existing_data, store, extraction_type='gestor', workers=None, chunk_size=256,
+                         metrics=None, cancel=None):
+        """Extract the listed XML files, appending their records to the store every chunk_size files.
+
+        Records are stored as they are extracted rather than after the whole list,
+        and the ones extracted before a cancellation are stored before it is raised,
+        so a new run over the same list only parses the files that are left.
+
+        :param existing_data: ProcessedIndex or DataFrame, as in build_xml_file_mapping.
+        :param cancel: Optional CancelToken, as in iter_extracted_data.
+        :return: Number of records inserted.
+        """
+        index = self._processed_index(existing_data, extraction_type)
+        pending_files = [xml_file_path for xml_file_path in new_files if self._claim(index, xml_file_path)]
+        logger.info(index.summary())
+
+        xml_data = self._empty_records(extraction_type)
+        counts = {'files': 0, 'inserted': 0}
+
+        def flush():
+            nonlocal xml_data
+            if xml_data[next(iter(xml_data))]:
+                counts['inserted'] += store.append(extraction_type, xml_data)
+                xml_data = self._empty_records(extraction_type)
+
+        results = self.iter_extracted_data(pending_files, extraction_type, workers, chunk_size, metrics, cancel)
+        try:
+            for xml_file_path, extracted_data, error in results:
+                self._add_record(xml_data, xml_file_path, extracted_data, error, extraction_type)
+                counts['files'] += 1
+                if counts['files'] % chunk_size == 0:
+                    flush()
+        except Cancelled:
+            flush()
+            raise
+        flush()
+        logger.info(f"{counts['inserted']} new {extraction_type} records saved to: {store.db_path}")
+        return counts['inserted']
+
+    def stream_to_store(self, file_queue, existing_data, store, extraction_type='gestor', workers=None,
+                        chunk_size=64, flush_interval=2.0, metrics=None, cancel=None):
+        """Extract the XML files put on file_queue while they arrive, appending each chunk to the store.
+
+        file_queue is a bounded queue.Queue of paths, closed with None, fed by a scan
+        that is still running. A chunk is parsed as soon as it holds chunk_size files
+        or no file arrived for flush_interval seconds, and its records are stored as
+        soon as it is done, so the first records land while the scan goes on.
+
+        :param existing_data: ProcessedIndex or DataFrame, as in build_xml_file_mapping.
+        :param workers: Number of worker processes; None or 1 parses in this thread.
+        :param metrics: Optional StageMetrics, as in iter_extracted_data.
+        :param cancel: Optional CancelToken, checked as each file arrives; the chunks
+                       already parsed are stored before Cancelled is raised.
+        :return: Number of records inserted.
+        """
+        if metrics is None:
+            metrics = StageMetrics()
+        index = self._processed_index(existing_data, extraction_type)
+        executor = ProcessPoolExecutor(max_workers=workers) if workers and workers > 1 else None
+        in_flight = deque()
+        chunk = []
+        counts = {'chunks': 0, 'inserted': 0}
+
+        def store_results(results):
+            xml_data = self._empty_records(extraction_type)
+            for xml_file_path, extracted_data, error in _record_timings(metrics, results):
+                self._add_record(xml_data, xml_file_path, extracted_data, error, extraction_type)
+            inserted = store.append(extraction_type, xml_data)
+            counts['chunks'] += 1
+            counts['inserted'] += inserted
+            logger.debug(f"Processed chunk {counts['chunks']} ({len(results)} files), {inserted} records saved")
+
+        def drain(block):
+            while in_flight and (block or in_flight[0].done()):
+                store_results(in_flight.popleft().result())
+
+        def submit():
+            if executor is None:
+                store_results(_extract_chunk(self.namespaces, chunk, extraction_type))
+                return
+            in_flight.append(executor.submit(_extract_chunk, self.namespaces, list(chunk), extraction_type))
+            # Keep at most two chunks per worker queued; the bounded file_queue then holds the scan back
+            if len(in_flight) >= 2 * workers:
+                store_results(in_flight.popleft().result())
+
+        try:
+            while True:
+                try:
+                    xml_file_path = file_queue.get(timeout=flush_interval if chunk else None)
+                except queue.Empty:
+                    submit()
+                    chunk.clear()
+                    continue
+                if xml_file_path is None:
+                    break
+                if cancel is not None and cancel.cancelled:
+                    drain(block=False)
+                    cancel.check()
+                if self._claim(index, xml_file_path):
+                    chunk.append(xml_file_path)
+                    if len(chunk) >= chunk_size:
+                        submit()
+                        chunk.clear()
+                drain(block=False)
+            if chunk:
+                submit()
+            drain(block=True)
+            # A cancel that arrived while the queue was closing still ends the extraction as cancelled
+            if cancel is not None:
+                cancel.check()
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+        logger.info(index.summary())
+        return counts['inserted']
+
+    def _empty_records(self, extraction_type):
+        return {col: [] for col in RECORD_TYPES[extraction_type].__slots__}
+
+    def _processed_index(self, existing_data, extraction_type):
+        if isinstance(existing_data, ProcessedIndex):
+            return existing_data
+        return ProcessedIndex.from_dataframe(existing_data, extraction_type)
+
+    def _claim(self, index, xml_file_path):
+        """Return True if the file must be parsed, adding it to the index."""
+        if not os.path.exists(xml_file_path):
+            logger.error(f"File not found: {xml_file_path}")
+            return False
+
+        file_name_without_ext = os.path.splitext(os.path.basename(xml_file_path))[0]
+
+        if file_name_without_ext in index:
+            index.skipped += 1
+            return False
+
+        # Indexing pending files also drops repeated names within this run
+        index.add(file_name_without_ext)
+        index.parsed += 1
+        return True
+
+    def _add_record(self, xml_data, xml_file_path, extracted_data, error, extraction_type):
+        """Append the record extracted from one file to the xml_data columns, logging extraction errors."""
+        try:
+            if error is not None:
+                raise error
+            if extracted_data is None:
+                raise ValueError("XML could not be parsed")
+
+            for column, value in zip(extracted_data.__slots__, extracted_data):
+                xml_data[column].append(value)
+        except ValueError as e:
+            logger.error(f"Error extracting data from file {xml_file_path}: {str(e)}")
+        except Exception as e:
+            logger.error(f"Unexpected error processing file {xml_file_path}: {str(e)}")
+
     def save_xml_data_to_excel(self, xml_data, excel_file_path, columns):
         """Save the XML data to an Excel file, combining with existing data and avoiding duplicates."""
         if not xml_data[next(iter(xml_data))]:  # Check if there's data in the first column
-            print("No new data to save.")
+            logger.info("No new data to save.")
             return
 
         existing_data = self.load_existing_data(excel_file_path, columns)
@@ -154,107 +428,162 @@ class XMLProcessor:
         combined_data = pd.concat([existing_data, new_data], ignore_index=True).drop_duplicates(subset=[columns[0]])
 
         combined_data.to_excel(excel_file_path, index=False)
-        print(f"Data saved to: {excel_file_path}")
+        logger.info(f"Data saved to: {excel_file_path}")
+
+    def save_xml_data_to_store(self, xml_data, store, extraction_type='gestor'):
+        """Append the XML data to the record store, keeping already stored keys untouched."""
+        if not xml_data[next(iter(xml_data))]:  # Check if there's data in the first column
+            logger.info("No new data to save.")
+            return 0
+
+        inserted = store.append(extraction_type, xml_data)
+        logger.info(f"{inserted} new {extraction_type} records saved to: {store.db_path}")
+        return inserted
+
+
+def _extract_one(processor, xml_file_path, extraction_type):
+    """Extract one file, returning (xml_file, extracted_data, error, seconds, bytes_read)."""
+    start = time.perf_counter()
+    bytes_before = processor.bytes_read
+    try:
+        extracted_data, error = processor.extract_data_from_xml(xml_file_path, extraction_type=extraction_type), None
+    except Exception as e:
+        extracted_data, error = None, e
+    return xml_file_path, extracted_data, error, time.perf_counter() - start, processor.bytes_read - bytes_before
+
+def _extract_chunk(namespaces, xml_files, extraction_type):
+    """Worker entry point: extract a chunk of files, returning errors instead of raising them."""
+    processor = XMLProcessor(namespaces)
+    return [_extract_one(processor, xml_file_path, extraction_type) for xml_file_path in xml_files]
+
+def _record_timings(metrics, results):
+    """Add the timings measured by _extract_one to metrics and yield (xml_file, extracted_data, error)."""
+    for xml_file_path, extracted_data, error, seconds, bytes_read in results:
+        metrics.count('files')
+        metrics.count('bytes_read', bytes_read)
+        metrics.observe('parse', seconds)
+        if error is not None or extracted_data is None:
+            metrics.count('errors')
+        yield xml_file_path, extracted_data, error
 
 
 class ExcelMerger:
-    def __init__(self, file1_path, file2_path, merge_column, output_file):
+    def __init__(self, file1_path, file2_path, merge_column, output_file, store=None):
         """
         Inicializa o ExcelMerger com os caminhos dos arquivos e a coluna de junção.
         
         :param file1_path: Caminho do primeiro arquivo Excel.
         :param file2_path: Caminho do segundo arquivo Excel.
         :param merge_column: Nome da coluna que será utilizada para a junção.
-        :param output_file: Caminho do arquivo Excel de saída.
+        :param output_file: Caminho do arquivo Excel de saída, ou lista de caminhos que
+                            recebem o mesmo resultado.
+        :param store: RecordStore opcional; quando informado, os dados de compras e gestor
+                      são lidos dele em vez dos arquivos Excel.
         """
         self.file1_path = file1_path
         self.file2_path = file2_path
         self.merge_column = merge_column
-        self.output_file = output_file
+        self.output_files = [output_file] if isinstance(output_file, str) else list(output_file)
+        self.output_file = self.output_files[0]
+        self.store = store
 
 
-    def merge_excel_files(self):
+    def merge_excel_files(self, full=False, tables=(), metrics=None, cancel=None):
         """
-        Realiza a junção dos dois arquivos Excel e salva o resultado em um novo arquivo.
+        Realiza a junção dos dois arquivos Excel uma única vez e salva o resultado em cada arquivo de saída.
+
+        Com um RecordStore, a junção é feita no banco e apenas as chaves novas desde a
+        última execução são combinadas novamente.
+
+        :param full: Refaz a junção completa no RecordStore.
+        :param tables: Saídas gravadas já formatadas como a tabela "Datatable".
+        :param metrics: StageMetrics opcional que recebe os tempos de junção e de gravação.
+        :param cancel: CancelToken opcional, verificado antes de gravar cada saída; a
+                       junção no RecordStore já gravada é aproveitada na próxima execução.
+        :return: DataFrame combinado.
         """
-        # Carrega os dados dos arquivos Excel
-        df1 = pd.read_excel(self.file1_path)
-        df2 = pd.read_excel(self.file2_path)
-        print(df1)
-        print(df2)
-
-        # Realiza a junção com base na coluna especificada
-        merged_df = pd.merge(df1, df2, on=self.merge_column, how='outer')
-        merged_df = pd.merge(merged_df, df2, left_on='chNF', right_on='chNTR')  
-        
-        merged_df = merged_df[['xMun','chNTR_x','nNF_x','chNF','nNF_y','vProd','xFant_y','dhEmi_x']].rename(columns={
-            'xMun':'Municipio',
-            'xFant_y' : 'FOR',
-            'chNTR_x':'chNTR',
-            'nNF_x': 'nNTR',
-            'nNF_y': 'nNF',
-            'vProd': 'Valor',
-            'dhEmi_x': 'Ano'
+        if metrics is None:
+            metrics = StageMetrics()
+        with metrics.timed('join'):
+            if self.store is not None:
+                joined = self.store.join(full=full)
+                logger.info(f"{joined} linhas combinadas atualizadas em {self.store.db_path}")
+                metrics.count('rows_joined', joined)
+                merged_df = self.store.load_combined()
+            else:
+                merged_df = self.join_frames(pd.read_excel(self.file1_path), pd.read_excel(self.file2_path))
+        metrics.count('rows', len(merged_df))
+
+        # Grava o resultado uma vez por formato e copia o arquivo para as demais saídas
+        written = {}
+        for output_file in self.output_files:
+            if cancel is not None:
+                cancel.check()
+            as_table = output_file in tables
+            with metrics.timed('write'):
+                if as_table in written:
+                    xlsx_export.replace_file(written[as_table], output_file)
+                else:
+                    xlsx_export.write_excel(merged_df, output_file, table=as_table)
+                    written[as_table] = output_file
+            metrics.count('bytes_written', os.path.getsize(output_file))
+            logger.info(f"Arquivos combinados e salvos em {output_file}")
+        return merged_df
+
+    def join_frames(self, df1, df2):
+        """
+        Junta compras (df1) e gestor (df2) por consultas indexadas na chave do gestor.
+
+        Mantém as linhas de compras cujo chNF existe no gestor; nNTR e Ano vêm do gestor
+        do chNTR da compra, nNF e FOR do gestor do chNF. Ordenado por chNTR.
+        """
+        gestor = df2.drop_duplicates(subset=[self.merge_column]).set_index(self.merge_column)
+        compras = df1[df1['chNF'].isin(gestor.index)]
+        g1 = gestor.reindex(compras[self.merge_column])
+        g2 = gestor.reindex(compras['chNF'])
+
+        merged_df = pd.DataFrame({
+            'Municipio': compras['xMun'].values,
+            'chNTR': compras[self.merge_column].values,
+            'nNTR': g1['nNF'].values,
+            'chNF': compras['chNF'].values,
+            'nNF': g2['nNF'].values,
+            'Valor': compras['vProd'].values,
+            'FOR': g2['xFant'].values,
+            'Ano': g1['dhEmi'].values,
         })
-        
-        #df2['nNF'] = df2['nNF'].astype(str)
-        #merged2 = pd.merge(df1, df2[['chNTR','nNF']], left_on='chNF',right_on='nNF')
-        
-        # Salva o resultado em um novo arquivo Excel
-        merged_df.to_excel(self.output_file, index=False)
-        print(f"Arquivos combinados e salvos em {self.output_file}")
+        return merged_df.sort_values('chNTR', kind='stable', na_position='last').reset_index(drop=True)
 
     def transform_to_table(self,file_path):
-
-        try:
-            wb = load_workbook(file_path)
-            sheet = wb.active
-
-            min_row = sheet.min_row
-            max_row = sheet.max_row
-            min_col = sheet.min_column
-            max_col = sheet.max_column
-            table_range = f"{sheet.cell(row=min_row, column=min_col).coordinate}:{sheet.cell(row=max_row,column=max_col).coordinate}"
-
-            table = Table(displayName="Datatable", ref=table_range)
-
-            style = TableStyleInfo(
-                        name="TableStyleMedium9",
-                        showFirstColumn=False,
-                        showLastColumn=False,
-                        showRowStripes=True,
-                        showColumnStripes=True,
-                    )
-            table.tableStyleInfo = style
-            sheet.add_table(table)
-
-            wb.save(file_path)
-            print(f"Tabela Criada com Sucesso em {file_path}")
-        except Exception as e:
-            print(f"Erro ao criar tabela!")
+        """Reescreve file_path com os dados formatados como a tabela "Datatable"."""
+        xlsx_export.transform_to_table(file_path)
 
 if __name__ == "__main__":
+    # Configure logging: errors go to xml_processing.log, progress messages to the console
+    error_log = logging.FileHandler('xml_processing.log')
+    error_log.setLevel(logging.ERROR)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s',
+                        handlers=[error_log, logging.StreamHandler()])
+
     # Define paths
     path_to = DIR()
 
     # Gestor processing
     processor = XMLProcessor()
-    new_gestor = path_to.new_gestor 
-    xl_gestor = path_to.xl_gestor
+    store = RecordStore(path_to.records_db)
+    store.import_excel('gestor', path_to.xl_gestor)
+    store.import_excel('compras', path_to.xl_compras)
 
-    new_files_gestor = processor.load_new_files_list(new_gestor)
-    existing_data_gestor = processor.load_existing_data(xl_gestor, ['chNTR', 'nNF', 'dhEmi', 'xFant'])
-    xml_data_gestor = processor.build_xml_file_mapping(new_files_gestor, existing_data_gestor, extraction_type='gestor')
-    processor.save_xml_data_to_excel(xml_data_gestor, xl_gestor, ['chNTR', 'nNF', 'dhEmi', 'xFant'])
+    new_files_gestor = processor.load_new_files_list(path_to.new_gestor)
+    existing_data_gestor = ProcessedIndex.from_store(store, 'gestor')
+    xml_data_gestor = processor.build_xml_file_mapping(new_files_gestor, existing_data_gestor, extraction_type='gestor', workers=os.cpu_count())
+    processor.save_xml_data_to_store(xml_data_gestor, store, extraction_type='gestor')
 
     # Compras processing
-    new_compras = path_to.new_compras
-    xl_compras = path_to.xl_compras
-
-    new_files_compras = processor.load_new_files_list(new_compras)
-    existing_data_compras = processor.load_existing_data(xl_compras, ['file_name', 'chNF', 'chNTR', 'xMun', 'vProd'])
-    xml_data_compras = processor.build_xml_file_mapping(new_files_compras, existing_data_compras, extraction_type='compras')
-    processor.save_xml_data_to_excel(xml_data_compras, xl_compras, ['file_name', 'chNF', 'chNTR', 'xMun', 'vProd'])
+    new_files_compras = processor.load_new_files_list(path_to.new_compras)
+    existing_data_compras = ProcessedIndex.from_store(store, 'compras')
+    xml_data_compras = processor.build_xml_file_mapping(new_files_compras, existing_data_compras, extraction_type='compras', workers=os.cpu_count())
+    processor.save_xml_data_to_store(xml_data_compras, store, extraction_type='compras')
 
     # Combiner processing
 
@@ -264,6 +593,6 @@ if __name__ == "__main__":
     output_file = path_to.xl_combi
     
 
-    merger = ExcelMerger(file1, file2, column_to_merge_on, output_file)
+    merger = ExcelMerger(file1, file2, column_to_merge_on, output_file, store=store)
     merger.merge_excel_files()
     
\ No newline at end of file